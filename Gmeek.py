@@ -1,48 +1,456 @@
 # -*- coding: utf-8 -*-
 import argparse
-import copy
+import cProfile
+import functools
+import hashlib
 import json
 import math
 import os
 import re
 import shutil
+import threading
 import time
 import urllib
-from collections import OrderedDict
+from collections import ChainMap, Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional
 
 import requests
 from feedgen.feed import FeedGenerator
-from github import Github
-from github.Issue import Issue
-from github.Repository import Repository
-from jinja2 import Environment, FileSystemLoader
-from transliterate import translit
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from lxml import etree
+from requests.adapters import HTTPAdapter
+from transliterate import get_translit_function
 from xpinyin import Pinyin
 
-from constant import I18N, ICONS, NEWLINE_CHAR
+from assets import ImageMirror, ImageMirrorRewriter
+from constant import I18N, ICONS, NEWLINE_CHAR, SEARCH_CJK_CHARS
+from postprocess import HighlightRewriter, LazyImageRewriter, MathRewriter, TocRewriter
+from postprocess import process as postprocess_html
 
 __VERSION__ = "1.0.0"
 
+GRAPHQL_ISSUE_FIELDS = """
+number
+title
+body
+createdAt
+updatedAt
+labels(first: 100, orderBy: {field: NAME, direction: ASC}) { nodes { name } }
+comments { totalCount }
+timelineItems(itemTypes: [PINNED_EVENT]) { totalCount }
+"""
+
+GRAPHQL_ISSUES_QUERY = """
+query($owner: String!, $name: String!, $num: Int!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    issues(first: $num, after: $cursor, states: OPEN, orderBy: {field: CREATED_AT, direction: ASC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes { %s }
+    }
+  }
+}
+""" % GRAPHQL_ISSUE_FIELDS
+
+GRAPHQL_ISSUE_QUERY = """
+query($owner: String!, $name: String!, $number: Int!) {
+  repository(owner: $owner, name: $name) {
+    issue(number: $number) { %s }
+  }
+}
+""" % GRAPHQL_ISSUE_FIELDS
+
+
+# The keys of blogBase recorded by the build itself, which are not a part of the site config
+BUILD_STATE_KEYS = [
+    "slug_mode",
+    "slugs",
+    "index_pages",
+    "label_pages",
+    "feed_pages",
+    "search_index",
+    "label_slugs",
+]
+# The keys of the summaries of the posts written into postList.json
+POST_LIST_KEYS = [
+    "labels",
+    "post_title",
+    "post_url",
+    "updated_time",
+    "created_date",
+    "dateLabelColor",
+    "md_path",
+]
+# The keys of the summaries of the posts in the lists of the labels and the search hits
+POST_ITEM_KEYS = ["post_title", "post_url", "labels", "created_date", "dateLabelColor"]
+SEARCH_CHUNK_SIZE = 100  # posts per chunk of the search hits, the same as in templates/tag.html
+ATOM_NAMESPACE = "http://www.w3.org/2005/Atom"
+FEED_HISTORY_NAMESPACE = "http://purl.org/syndication/history/1.0"  # RFC 5005
+
+SEARCH_TOKEN_PATTERN = re.compile(rf"[{SEARCH_CJK_CHARS}]+|[^\W_{SEARCH_CJK_CHARS}]+")
+
+
+class IssueRecord(NamedTuple):
+    """The issue information used to build a post, independent of the API it is fetched from."""
+
+    number: int
+    title: str
+    body: str
+    labels: List[str]
+    created_at: datetime
+    updated_at: datetime
+    num_comments: int
+    top: int
+
+
+class PostSummary:
+    """The summary of a post kept in blogBase for the index, label, feed and list pages.
+
+    It holds the post configuration without the bulky inlined script and style, in slots
+    instead of a dict to keep the memory of tens of thousands of posts small. It is read like a
+    dict, also by the templates, and a key missing from the configuration is missing from it.
+    """
+
+    __slots__ = (
+        "html_dir",
+        "labels",
+        "post_title",
+        "post_url",
+        "post_source_url",
+        "num_comments",
+        "top",
+        "updated_time",
+        "num_words",
+        "description",
+        "created_time",
+        "og_image",
+        "show_toc",
+        "created_date",
+        "dateLabelColor",
+        "md_path",
+        "assets",
+        "search_digest",
+    )
+
+    def __init__(self, post_cfg: dict):
+        for key in self.__slots__:
+            if key in post_cfg:
+                setattr(self, key, post_cfg[key])
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__ or not hasattr(self, key):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__ and hasattr(self, key)
+
+    def get(self, key: str, default=None):
+        return self[key] if key in self else default
+
+    def to_dict(self) -> dict:
+        return {key: getattr(self, key) for key in self.__slots__ if hasattr(self, key)}
+
+
+class BuildReport:
+    """Record the duration, the GitHub API usage and the written bytes of the build stages.
+
+    Nested stages are timed inclusively. Requests and written bytes are counted in the innermost
+    stage running in the current thread.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.start_time = time.time()
+        self.stages = {}
+        self.requests = Counter()  # "METHOD /path" -> number of requests
+        self.num_not_modified = 0  # conditional requests answered with 304
+        self.rate_limits = {}  # resource of the rate limit -> remaining requests
+        self.bytes_written = 0
+
+    def get_stage_info(self, name: str):
+        return self.stages.setdefault(
+            name, {"seconds": 0.0, "calls": 0, "requests": 0, "bytes_written": 0}
+        )
+
+    def get_current_stage(self):
+        stack = getattr(self.local, "stack", None)
+        return stack[-1] if stack else "other"
+
+    @contextmanager
+    def stage(self, name: str):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        self.local.stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.local.stack.pop()
+            with self.lock:
+                stage_info = self.get_stage_info(name)
+                stage_info["seconds"] += time.perf_counter() - start
+                stage_info["calls"] += 1
+
+    def add_request(self, response: requests.Response):
+        path = urllib.parse.urlparse(response.url).path
+        with self.lock:
+            self.requests[f"{response.request.method} {path}"] += 1
+            self.num_not_modified += int(response.status_code == 304)
+            self.get_stage_info(self.get_current_stage())["requests"] += 1
+            if "X-RateLimit-Remaining" in response.headers:
+                resource = response.headers.get("X-RateLimit-Resource", "core")
+                self.rate_limits[resource] = int(response.headers["X-RateLimit-Remaining"])
+
+    def add_bytes_written(self, num_bytes: int):
+        with self.lock:
+            self.bytes_written += num_bytes
+            self.get_stage_info(self.get_current_stage())["bytes_written"] += num_bytes
+
+    def to_dict(self):
+        with self.lock:
+            stages = {
+                name: dict(stage_info, seconds=round(stage_info["seconds"], 4))
+                for name, stage_info in self.stages.items()
+            }
+            return {
+                "start_time": datetime.fromtimestamp(self.start_time, timezone.utc).isoformat(),
+                "seconds": round(time.time() - self.start_time, 4),
+                "stages": stages,
+                "requests": dict(self.requests),
+                "num_requests": sum(self.requests.values()),
+                "num_not_modified": self.num_not_modified,
+                "rate_limit_remaining": dict(self.rate_limits),
+                "bytes_written": self.bytes_written,
+            }
+
+
+class StateStore:
+    """Keep the state of the blog in `state/` instead of a single `blogBase.json`.
+
+    - `site.json`: the site configuration and everything else except the posts.
+    - `index.json`: the summaries of the posts and sub pages (`PostSummary`), which is all the
+      shared pages need.
+    - `posts/P<number>.json`: the full configuration of every post, loaded only on demand.
+    - `search/P<number>.json`: the terms of every post in the search index.
+
+    The files are written only when their content changes, so a single-issue update rewrites
+    the index, the site record if needed and the shard of the issue.
+    """
+
+    def __init__(self, state_dir: str, write: Callable):
+        self.state_dir = state_dir
+        self.post_state_dir = state_dir + "posts/"
+        self.search_state_dir = state_dir + "search/"
+        self.site_path = state_dir + "site.json"
+        self.index_path = state_dir + "index.json"
+        self.write = write  # (path, content) -> whether the file is written
+
+    def exists(self) -> bool:
+        return os.path.exists(self.site_path) and os.path.exists(self.index_path)
+
+    @staticmethod
+    def summarize(post_cfg: dict) -> PostSummary:
+        return PostSummary(post_cfg)
+
+    def load(self) -> dict:
+        """Load the site record and the summaries of the posts as a blogBase."""
+        with open(self.site_path, "r", encoding="utf-8") as f:
+            blog_base = json.load(f)
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        for post_type, summaries in index.items():
+            blog_base[post_type] = {key: PostSummary(s) for key, s in summaries.items()}
+        return blog_base
+
+    def load_post(self, key: str) -> dict:
+        with open(self.post_state_dir + f"{key}.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_post(self, key: str, post_cfg: dict):
+        os.makedirs(self.post_state_dir, exist_ok=True)
+        self.write(self.post_state_dir + f"{key}.json", json.dumps(post_cfg, indent=2))
+
+    def load_search_terms(self, key: str) -> Optional[list]:
+        path = self.search_state_dir + f"{key}.json"
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_search_terms(self, key: str, terms: list):
+        os.makedirs(self.search_state_dir, exist_ok=True)
+        terms_str = json.dumps(terms, ensure_ascii=False, separators=(",", ":"))
+        self.write(self.search_state_dir + f"{key}.json", terms_str)
+
+    def save(self, blog_base: dict, prune: bool = False):
+        """Save the site record and the index, the shards are saved by `save_post`.
+
+        Args:
+            blog_base (dict): blogBase whose posts and sub_pages hold the summaries.
+            prune (bool, optional): Remove the shards and the search terms of the posts not in
+                blog_base. Defaults to False.
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        index = {post_type: blog_base[post_type] for post_type in ["posts", "sub_pages"]}
+        site = {k: v for k, v in blog_base.items() if k not in index}
+        self.write(self.site_path, json.dumps(site, indent=2))
+        self.write(self.index_path, json.dumps(index, indent=2, default=PostSummary.to_dict))
+
+        if not prune:
+            return
+        keys = set(index["posts"]) | set(index["sub_pages"])
+        for state_dir in [self.post_state_dir, self.search_state_dir]:
+            if not os.path.exists(state_dir):
+                continue
+            for name in os.listdir(state_dir):
+                if name[: -len(".json")] not in keys:
+                    os.remove(state_dir + name)
+
+    def migrate(self, legacy_path: str):
+        """Split the `blogBase.json` of the older versions into the state files."""
+        with open(legacy_path, "r") as f:
+            blog_base = json.load(f)
+        for post_type in ["posts", "sub_pages"]:
+            for key, post_cfg in blog_base[post_type].items():
+                self.save_post(key, post_cfg)
+                blog_base[post_type][key] = self.summarize(post_cfg)
+        self.save(blog_base)
+        os.remove(legacy_path)
+        print(f"migrate {legacy_path} to {self.state_dir}")
+
+
+@functools.lru_cache(maxsize=None)
+def get_pinyin() -> Pinyin:
+    """Return the process-wide Pinyin, which loads its dictionary when it is created."""
+    return Pinyin()
+
+
+@functools.lru_cache(maxsize=None)
+def get_translit(language_code: str) -> Callable:
+    """Return the process-wide transliteration function of the language."""
+    return get_translit_function(language_code)
+
+
+def parse_issue_numbers(text) -> List[int]:
+    """Parse the issue numbers separated by commas or whitespace, e.g. "3, 5 8".
+
+    The duplicates and "0", the number of the full build, are dropped.
+    """
+    numbers = [int(n) for n in re.split(r"[\s,]+", str(text or "").strip()) if n]
+    return list(dict.fromkeys(n for n in numbers if n > 0))
+
+
+def build_stage(name: str):
+    """Record the decorated method of GMEEK as a stage of the build report."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.report.stage(name):
+                return func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
 
 class GMEEK:
-    def __init__(self, github_token, repo_name, issue_number):
+    def __init__(self, github_token, repo_name, issue_numbers, root_dir="docs/"):
         self.github_token = github_token
         self.repo_name = repo_name
-        self.issue_number = issue_number
+        # the issues to update, all posts are checked if it is empty
+        if not isinstance(issue_numbers, list):
+            issue_numbers = parse_issue_numbers(issue_numbers)
+        self.issue_numbers = issue_numbers
 
-        self.root_dir = "docs/"
+        self.root_dir = root_dir
         self.post_folder = "post/"
         self.backup_dir = "backup/"
+        self.state_dir = "state/"
+        self.cache_dir = "cache/"
+        self.markdown_cache_dir = self.cache_dir + "markdown/"
+        self.http_cache_dir = self.cache_dir + "http/"
+        self.jinja_cache_dir = self.cache_dir + "jinja/"
         self.post_dir = self.root_dir + self.post_folder
-        self.old_feed_string = ""
+        self.search_dir = self.root_dir + "search/"
+        self.feed_archive_dir = self.root_dir + "feed/"
+        self.manifest_path = self.root_dir + "manifest.json"
+        # relative path in root_dir -> [sha256, size, mtime_ns] of the file
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+
+        # "api": the GitHub Markdown API, "local": the in-process renderer in gfm.py
+        self.markdown_renderers = {
+            "api": self.render_markdown_api,
+            "local": self.render_markdown_local,
+        }
 
-        self.repo = self.get_repo(token=github_token, repo=self.repo_name)
-        self.label_color_info = {l.name: "#" + l.color for l in self.repo.get_labels()}
-        print(self.label_color_info)
+        self.assets_dir = self.root_dir + "assets/"
+        self.image_cache_dir = self.cache_dir + "images/"
+        self.state = StateStore(self.state_dir, self.write_output)
 
+        # The factories of the rewriters, which process the html of every post in a single pass
+        self.post_rewriters = [MathRewriter, HighlightRewriter, LazyImageRewriter, TocRewriter]
+
+        self.rate_limit_lock = threading.Lock()
+        self.rate_limit_until = 0.0
+
+        # The compiled templates are shared by all renders, and their bytecode is kept on disk
+        # so that the later runs can skip compiling them.
+        os.makedirs(self.jinja_cache_dir, exist_ok=True)
+        self.jinja_env = Environment(
+            loader=FileSystemLoader("templates"),
+            bytecode_cache=FileSystemBytecodeCache(self.jinja_cache_dir),
+        )
+
+        # GitHub Actions sets it for GitHub Enterprise, and the benchmark for its local stand-in
+        self.api_url = os.environ.get("GITHUB_API_URL", "https://api.github.com")
+        self.report = BuildReport()
+        self.label_color_info = {}
         self.initialize_config()
 
+        # All GitHub requests share one session, which keeps the connections alive
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = "token {}".format(self.github_token)
+        # The issues are fetched on the main thread, their events in one pool of max_workers
+        # threads, and the posts rendered in another one while the issues are streamed.
+        pool_size = 2 * max(self.blogBase["max_workers"], 1) + 1
+        adapter = HTTPAdapter(pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.image_mirror = None
+        if self.blogBase["mirror_images"]:
+            # a session without the token, since the images can be hosted anywhere
+            image_session = requests.Session()
+            image_session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+            image_session.mount("http://", HTTPAdapter(pool_maxsize=pool_size))
+            self.image_mirror = ImageMirror(
+                image_session,
+                self.image_cache_dir,
+                self.assets_dir,
+                self.blogBase["image_widths"],
+                self.write_output,
+            )
+            assets_url = self.blogBase["home_url"] + "/" + self.assets_dir[len(self.root_dir) :]
+            self.post_rewriters.insert(
+                0, lambda: ImageMirrorRewriter(self.image_mirror, assets_url)
+            )
+
+        with self.report.stage("repo"):
+            self.label_color_info.update(self.fetch_label_colors())
+        print(self.label_color_info)
+
+    def fetch_label_colors(self) -> dict:
+        labels = self.iter_rest_pages(f"/repos/{self.repo_name}/labels", {"per_page": 100})
+        return {l["name"]: "#" + l["color"] for l in labels}
+
     def initialize_config(self):
         self.blogBase = {
             "sub_page_labels": [],  # For the single page with a unique label. e.g. "about, link"
@@ -64,10 +472,28 @@ class GMEEK:
             "UTC": +8,
             "rss_split": "sentence",
             "extra_links": {},
+            "fetch_mode": "graphql",  # "graphql": batch queries, "rest": per-issue rest calls
+            "graphql_page_size": 50,
+            "max_workers": 4,  # concurrency of the post pipeline, 1 means building posts one by one
+            "max_retries": 5,  # max attempts of a rate-limited request
+            "markdown_renderer": "api",  # key of GMEEK.markdown_renderers
+            "markdown_cache_size": 4096,  # max number of rendered bodies kept in cache/markdown
+            "http_cache_size": 16384,  # max number of api responses kept in cache/http
+            "incremental_build": 1,  # only re-render the changed posts in a full run
+            "rss_max_items": 50,  # newest items in rss.xml, the older in archives, 0 means all
+            "show_toc": 0,  # show the table of contents above the posts
+            "mirror_images": 0,  # serve the images of the posts from docs/assets
+            "image_widths": [480, 960],  # widths of the resized images for srcset, needs Pillow
             # should not be overrode
             "posts": OrderedDict(),  # 文章post页面信息 postListJson
             "sub_pages": OrderedDict(),  # 独立网页页面信息 singeListJson
             "label_color_info": self.label_color_info,
+            "slugs": {},  # key of the post -> file name of the post, kept across runs
+            "index_pages": {},  # file name of the index page -> fingerprint of its content
+            "label_pages": {},  # file name of the page of a label -> fingerprint of its content
+            "feed_pages": {},  # file name of the feed -> fingerprint of its items
+            "search_index": {},  # key of the post -> search_digest of the post in the index
+            "label_slugs": {},  # label -> file name of the pages of the label, kept across runs
         }
 
         # 加载用户自定义的html格式的脚本和样式
@@ -86,20 +512,38 @@ class GMEEK:
         self.blogBase.setdefault("og_image", self.blogBase["avatar_url"])
 
         if "home_url" not in self.blogBase:
-            user_github_io = f"{self.repo.owner.login}.github.io"
+            owner, name = self.repo_name.split("/")
+            user_github_io = f"{owner}.github.io"
 
             self.blogBase["home_url"] = f"https://{user_github_io}"
-            if f"{self.repo.name}".lower() != user_github_io.lower():
+            if f"{name}".lower() != user_github_io.lower():
                 # 非user.github.io仓库
-                self.blogBase["home_url"] += f"/{self.repo.name}"
+                self.blogBase["home_url"] += f"/{name}"
         print("GitHub Pages URL: ", self.blogBase["home_url"])
 
         self.i18n = I18N.get(self.blogBase["i18n"], "EN")
         self.TZ = timezone(timedelta(hours=self.blogBase["UTC"]))
+        self.blogBase["slug_mode"] = self.blogBase["url_mode"]  # url_mode of the slugs
+        self.blogBase["fingerprint"] = self.create_fingerprint()
 
-    @staticmethod
-    def get_repo(token: str, repo: str) -> Repository:
-        return Github(login_or_token=token).get_repo(repo)
+    def create_fingerprint(self):
+        """Hash everything except the issues that the rendered posts depend on.
+
+        It covers the version of GmeekSelf, the site configuration and the templates. When it
+        changes, the incremental build re-renders all posts.
+        """
+        sha = hashlib.sha256(__VERSION__.encode("utf-8"))
+        site_cfg = {
+            k: v
+            for k, v in self.blogBase.items()
+            if k
+            not in ["posts", "sub_pages", "label_color_info", "fingerprint"] + BUILD_STATE_KEYS
+        }
+        sha.update(json.dumps(site_cfg, sort_keys=True).encode("utf-8"))
+        for name in sorted(os.listdir("templates")):
+            with open(os.path.join("templates", name), "rb") as f:
+                sha.update(name.encode("utf-8") + b"\0" + f.read())
+        return sha.hexdigest()
 
     @staticmethod
     def generate_post_description(issueBody: str = None):
@@ -112,38 +556,409 @@ class GMEEK:
         postDescription = ""
         return postDescription
 
+    @build_stage("render_html")
     def render_html(self, template, blogBase, icon, html, posts=None):
-        file_loader = FileSystemLoader("templates")
-        env = Environment(loader=file_loader)
-        template = env.get_template(template)
+        template = self.jinja_env.get_template(template)
 
         posts = posts or {}
         output = template.render(blogBase=blogBase, posts=posts, i18n=self.i18n, IconList=icon)
-        with open(html, "w", encoding="UTF-8") as f:
-            f.write(output)
-        print(f"create {html} with template {template}")
+        if self.write_output(html, output):
+            print(f"create {html} with template {template}")
+        else:
+            print(f"skip unchanged {html}")
 
-    def markdown2html(self, mdstr: str):
-        payload = {"text": mdstr, "mode": "gfm"}
-        headers = {"Authorization": "token {}".format(self.github_token)}
-        try:
-            response = requests.post(
-                "https://api.github.com/markdown", json=payload, headers=headers
+    def write_output(self, path: str, content) -> bool:
+        """Write the generated content to the path only if it differs from the existing file.
+
+        The changed file is written to a temporary file and renamed into place, so the readers
+        never see a partial file and the unchanged files keep their mtime. The hashes of the
+        files in root_dir are recorded in the manifest to avoid reading them back, see
+        `output_digest`.
+
+        Args:
+            path (str): Output path.
+            content (str or bytes): Generated content, str is encoded with UTF-8.
+
+        Returns:
+            bool: Whether the file is written.
+        """
+        data = content.encode("utf-8") if isinstance(content, str) else content
+        digest = hashlib.sha256(data).hexdigest()
+
+        key = self.output_key(path)
+        if self.output_digest(path) != digest:
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self.report.add_bytes_written(len(data))
+            written = True
+        else:
+            written = False
+        if key is not None:
+            stat = os.stat(path)
+            self.manifest[key] = [digest, stat.st_size, stat.st_mtime_ns]
+        return written
+
+    def output_key(self, path: str) -> Optional[str]:
+        """Return the key of the path in the manifest, or None if it is not in root_dir."""
+        if os.path.abspath(path).startswith(os.path.abspath(self.root_dir) + os.sep):
+            return os.path.relpath(path, self.root_dir).replace(os.sep, "/")
+        return None
+
+    def output_digest(self, path: str) -> Optional[str]:
+        """Return the sha256 of the file, or None if it does not exist.
+
+        The digest in the manifest is used while the file has the size and mtime recorded with
+        it. Otherwise the file is hashed again, e.g. it is edited by hand or checked out again,
+        and the entry is refreshed if the content is still the recorded one.
+        """
+        if not os.path.exists(path):
+            return None
+        key = self.output_key(path)
+        stat = os.stat(path)
+        entry = self.manifest.get(key)
+        # a plain digest is recorded by the older versions, without the size and mtime
+        if isinstance(entry, list) and entry[1:] == [stat.st_size, stat.st_mtime_ns]:
+            return entry[0]
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        if entry is not None and digest == (entry[0] if isinstance(entry, list) else entry):
+            self.manifest[key] = [digest, stat.st_size, stat.st_mtime_ns]
+        return digest
+
+    def output_intact(self, path: str) -> bool:
+        """Whether the output file exists and is the one written by the last run.
+
+        The pages of unchanged fingerprints are skipped only if this holds, so that a page
+        changed or removed outside of the build is generated again.
+        """
+        entry = self.manifest.get(self.output_key(path))
+        if entry is None:  # not recorded, e.g. by the older versions
+            return os.path.exists(path)
+        return self.output_digest(path) == (entry[0] if isinstance(entry, list) else entry)
+
+    def remove_output(self, path: str):
+        if os.path.exists(path):
+            os.remove(path)
+        self.manifest.pop(self.output_key(path), None)
+
+    def save_report(self):
+        """Write the build report to `build-report.json` in cache_dir and print its summary.
+
+        It is kept out of root_dir, since its timings change on every run and would otherwise
+        publish a change of the site when nothing else has changed.
+        """
+        report = self.report.to_dict()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.write_output(self.cache_dir + "build-report.json", json.dumps(report, indent=2))
+
+        print("====== build report ======")
+        for name, stage_info in report["stages"].items():
+            print(
+                f"{name:<24} {stage_info['seconds']:>9.3f}s calls={stage_info['calls']:<6} "
+                f"requests={stage_info['requests']:<6} bytes={stage_info['bytes_written']}"
             )
-            response.raise_for_status()  # Raises an exception if status code is not 200
-            return response.text
+        print(f"requests={report['num_requests']} not_modified={report['num_not_modified']}")
+        print(f"rate limit remaining={report['rate_limit_remaining']}")
+
+    def save_manifest(self):
+        # written like the other outputs, but without an entry of its own
+        key = os.path.relpath(self.manifest_path, self.root_dir)
+        self.manifest.pop(key, None)
+        self.write_output(
+            self.manifest_path, json.dumps(dict(sorted(self.manifest.items())), indent=2)
+        )
+        self.manifest.pop(key, None)
+
+    def request_github(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request to the GitHub API and retry it after backing off from the rate limit.
+
+        The back-off is shared by all worker threads, so a rate-limited response pauses the
+        whole pipeline instead of letting the other workers keep hitting the API.
+
+        Raises:
+            requests.RequestException: The request fails or is still rate-limited after retries.
+        """
+        for _ in range(self.blogBase["max_retries"]):
+            with self.rate_limit_lock:
+                delay = self.rate_limit_until - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+            response = self.session.request(method, url, **kwargs)
+            self.report.add_request(response)
+            if not self.backoff_rate_limit(response):
+                break
+        response.raise_for_status()  # Raises an exception if status code is not 200
+        return response
+
+    def rest_get(self, url: str, params: dict = None):
+        """GET a resource of the REST API and revalidate the cached copy of it.
+
+        The responses are cached in `cache/http/` with their ETag and Last-Modified. They are
+        sent back as If-None-Match and If-Modified-Since, so an unchanged resource comes back as
+        304, which does not count against the rate limit.
+
+        Args:
+            url (str): Absolute url or path of the resource.
+            params (dict, optional): Query parameters. Defaults to None.
+
+        Returns:
+            tuple: The json data and the pagination links of the resource.
+        """
+        if url.startswith("/"):
+            url = self.api_url + url
+        query = urllib.parse.urlencode(sorted((params or {}).items()))
+        key = hashlib.sha256(f"{url}?{query}".encode("utf-8")).hexdigest()
+        cache_path = self.http_cache_dir + key + ".json"
+
+        cached = None
+        headers = {}
+        if os.path.exists(cache_path):
+            os.utime(cache_path)  # mark as recently used for the eviction
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = self.request_github("GET", url, params=params, headers=headers)
+        if response.status_code == 304:
+            return cached["data"], cached["links"]
+
+        cached = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "links": {rel: link["url"] for rel, link in response.links.items()},
+            "data": response.json(),
+        }
+        os.makedirs(self.http_cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cached, f)
+        os.replace(tmp_path, cache_path)
+        return cached["data"], cached["links"]
+
+    def iter_rest_pages(self, url: str, params: dict = None) -> Iterator[dict]:
+        """Yield the items of a paginated REST resource by following its next links."""
+        while url:
+            items, links = self.rest_get(url, params)
+            yield from items
+            url, params = links.get("next"), None  # the next link carries the query
+
+    def backoff_rate_limit(self, response: requests.Response) -> bool:
+        """Schedule a back-off if the response is rejected by a primary or secondary rate limit.
+
+        Returns:
+            bool: Whether the request has been rate-limited and should be retried.
+        """
+        if response.status_code not in (403, 429):
+            return False
+
+        if "Retry-After" in response.headers:
+            delay = int(response.headers["Retry-After"])
+        elif response.headers.get("X-RateLimit-Remaining") == "0":
+            delay = int(response.headers["X-RateLimit-Reset"]) - time.time()
+        elif "rate limit" in response.text.lower():
+            delay = 60  # the secondary rate limit without any hint, wait at least one minute
+        else:
+            return False
+
+        delay = max(delay, 1)
+        with self.rate_limit_lock:
+            self.rate_limit_until = max(self.rate_limit_until, time.time() + delay)
+        print(f"rate limited by {response.url}, wait {delay:.0f}s")
+        return True
+
+    def map_concurrently(self, func: Callable, items: Iterable) -> list:
+        """Apply func to the items with at most `max_workers` threads and keep the input order."""
+        return [result for _, result in self.stream_concurrently(func, items)]
+
+    def stream_concurrently(self, func: Callable, items: Iterable) -> Iterator[tuple]:
+        """Apply func to the items with at most `max_workers` threads and yield (item, result).
+
+        The items are consumed lazily and yielded in the input order, and at most twice
+        `max_workers` of them are in flight, so a long stream is never held in memory at once.
+        """
+        max_workers = self.blogBase["max_workers"]
+        if max_workers <= 1:
+            for item in items:
+                yield item, func(item)
+            return
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque()
+            for item in items:
+                pending.append((item, executor.submit(func, item)))
+                if len(pending) >= 2 * max_workers:
+                    item, future = pending.popleft()
+                    yield item, future.result()
+            while pending:
+                item, future = pending.popleft()
+                yield item, future.result()
+
+    @build_stage("markdown2html")
+    def markdown2html(self, mdstr: str, mode: str = "gfm"):
+        """Render the markdown text into html with the renderer selected by `markdown_renderer`.
+
+        The rendered html is cached in `cache/markdown/` and keyed by the hash of the renderer,
+        the render mode and the markdown text, so only new or edited texts are rendered again.
+
+        Args:
+            mdstr (str): Markdown text.
+            mode (str, optional): Render mode of the API. Defaults to "gfm".
+
+        Returns:
+            str: The rendered html.
+        """
+        renderer = self.blogBase["markdown_renderer"]
+        key = hashlib.sha256(f"{renderer}\0{mode}\0{mdstr}".encode("utf-8")).hexdigest()
+        cache_path = self.markdown_cache_dir + key + ".html"
+        if os.path.exists(cache_path):
+            os.utime(cache_path)  # mark as recently used for the eviction
+            with open(cache_path, "r", encoding="UTF-8", newline="") as f:
+                return f.read()
+
+        html = self.markdown_renderers[renderer](mdstr, mode)
+
+        # posts with the same text may be rendered concurrently, so replace the file atomically
+        os.makedirs(self.markdown_cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="UTF-8", newline="") as f:
+            f.write(html)
+        os.replace(tmp_path, cache_path)
+        return html
+
+    def render_markdown_api(self, mdstr: str, mode: str):
+        payload = {"text": mdstr, "mode": mode}
+        try:
+            response = self.request_github("POST", self.api_url + "/markdown", json=payload)
         except requests.RequestException as e:
             raise Exception("markdown2html error: {}".format(e))
+        return response.text
+
+    @staticmethod
+    def render_markdown_local(mdstr: str, mode: str):
+        # the local renderer depends on markdown-it-py, which is only imported when it is used
+        import gfm
+
+        return gfm.render(mdstr)
 
-    def create_post_html(self, post_cfg: dict):
-        with open(post_cfg["md_path"], "r", encoding="UTF-8") as f:
-            post_body = self.markdown2html(f.read())
+    @staticmethod
+    def prune_cache(cache_dir: str, cache_size: int):
+        """Evict the least recently used entries until the cache has at most cache_size ones."""
+        if not os.path.exists(cache_dir):
+            return
+
+        entries = [e for e in os.scandir(cache_dir) if not e.name.endswith(".tmp")]
+        num_evicted = len(entries) - cache_size
+        if num_evicted <= 0:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:num_evicted]:
+            os.remove(entry.path)
+        print(f"evict {num_evicted} entries from {cache_dir}")
+
+    @build_stage("issue_metadata")
+    def graphql(self, query: str, variables: dict):
+        try:
+            response = self.request_github(
+                "POST",
+                self.api_url + "/graphql",
+                json={"query": query, "variables": variables},
+            )
+        except requests.RequestException as e:
+            raise Exception("graphql error: {}".format(e))
+
+        result = response.json()
+        if result.get("errors"):
+            raise Exception("graphql error: {}".format(result["errors"]))
+        return result["data"]
+
+    @staticmethod
+    def issue_record_from_graphql(node: dict) -> IssueRecord:
+        return IssueRecord(
+            number=node["number"],
+            title=node["title"],
+            body=node["body"],
+            labels=[label["name"] for label in node["labels"]["nodes"]],
+            created_at=datetime.strptime(node["createdAt"], "%Y-%m-%dT%H:%M:%SZ"),
+            updated_at=datetime.strptime(node["updatedAt"], "%Y-%m-%dT%H:%M:%SZ"),
+            num_comments=node["comments"]["totalCount"],
+            top=int(node["timelineItems"]["totalCount"] > 0),
+        )
+
+    @build_stage("issue_metadata")
+    def issue_record_from_rest(self, issue: dict) -> IssueRecord:
+        top = 0
+        for event in self.iter_rest_pages(issue["url"] + "/events", {"per_page": 100}):
+            if event["event"] == "pinned":
+                top = 1
+            # elif event["event"] == "unpinned":
+            #     top = 0
+
+        return IssueRecord(
+            number=issue["number"],
+            title=issue["title"],
+            body=issue["body"],
+            labels=[label["name"] for label in issue["labels"]],
+            created_at=datetime.strptime(issue["created_at"], "%Y-%m-%dT%H:%M:%SZ"),
+            updated_at=datetime.strptime(issue["updated_at"], "%Y-%m-%dT%H:%M:%SZ"),
+            num_comments=issue["comments"],
+            top=top,
+        )
+
+    def iter_issue_records(self) -> Iterator[IssueRecord]:
+        """Yield the records of all open issues from the oldest, page by page as they arrive.
+
+        With `fetch_mode="graphql"`, title, body, labels, comment count and pin state of a whole
+        page of issues come from a single query instead of several rest calls per issue.
+        """
+        if self.blogBase["fetch_mode"] != "graphql":
+            # the events of the issues are requested concurrently
+            params = {"state": "open", "sort": "created", "direction": "asc", "per_page": 100}
+            issues = self.iter_rest_pages(f"/repos/{self.repo_name}/issues", params)
+            issues = (issue for issue in issues if len(issue["labels"]) > 0)
+            for _, record in self.stream_concurrently(self.issue_record_from_rest, issues):
+                yield record
+            return
+
+        owner, name = self.repo_name.split("/")
+        variables = {"owner": owner, "name": name, "num": self.blogBase["graphql_page_size"]}
+        cursor = None
+        while True:
+            variables["cursor"] = cursor
+            issues = self.graphql(GRAPHQL_ISSUES_QUERY, variables)["repository"]["issues"]
+            print(f"fetch {len(issues['nodes'])} issues with graphql")
+            for node in issues["nodes"]:
+                yield self.issue_record_from_graphql(node)
+            if not issues["pageInfo"]["hasNextPage"]:
+                break
+            cursor = issues["pageInfo"]["endCursor"]
+
+    def get_issue_record(self, number: int) -> IssueRecord:
+        if self.blogBase["fetch_mode"] != "graphql":
+            issue, _ = self.rest_get(f"/repos/{self.repo_name}/issues/{number}")
+            return self.issue_record_from_rest(issue)
+
+        owner, name = self.repo_name.split("/")
+        variables = {"owner": owner, "name": name, "number": number}
+        node = self.graphql(GRAPHQL_ISSUE_QUERY, variables)["repository"]["issue"]
+        return self.issue_record_from_graphql(node)
+
+    def create_post_html(self, post_cfg: dict, post_md: str = None):
+        if post_md is None:
+            with open(post_cfg["md_path"], "r", encoding="UTF-8") as f:
+                post_md = f.read()
+        post_body = self.markdown2html(post_md)
+        post_body, page = postprocess_html(post_body, [f() for f in self.post_rewriters])
 
         # Import mathjax for supporting the math formulas
-        if "<math-renderer" in post_body:
-            post_body = re.sub(r"<math-renderer.*?>", "", post_body)
-            post_body = re.sub(r"</math-renderer>", "", post_body)
-            post_cfg["script"] += "".join(
+        script = post_cfg["script"]
+        if page["math"]:
+            script += "".join(
                 [
                     '<script>MathJax = {tex: {inlineMath: [["$", "$"]]}};</script>',
                     '<script async src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js"></script>',
@@ -151,19 +966,23 @@ class GMEEK:
             )
 
         assert "post_title" in post_cfg, post_cfg.keys()
-        post_info = copy.deepcopy(self.blogBase)
+        # The post settings are layered over the site settings, and the writes only go to the
+        # post layer, so the catalogue of posts in blogBase is shared instead of copied.
+        post_info = ChainMap({}, self.blogBase)
         post_info["post_title"] = post_cfg["post_title"]
         post_info["post_url"] = self.blogBase["home_url"] + "/" + post_cfg["post_url"]
         post_info["description"] = post_cfg["description"]
-        post_info["og_image"] = post_cfg["og_image"]
+        post_info["og_image"] = self.mirror_image_url(post_cfg["og_image"])
         post_info["post_body"] = post_body
         post_info["num_comments"] = post_cfg["num_comments"]
         post_info["style"] = post_cfg["style"]
-        post_info["script"] = post_cfg["script"]
+        post_info["script"] = script
         post_info["top"] = post_cfg["top"]
         post_info["post_source_url"] = post_cfg["post_source_url"]
         post_info["repo_name"] = self.repo_name
-        post_info["highlight"] = int("highlight" in post_body)
+        post_info["highlight"] = page["highlight"]
+        post_info["toc"] = page["toc"] if post_cfg.get("show_toc") else ""
+        post_cfg["assets"] = page.get("assets", [])
 
         if post_cfg["labels"][0] in self.blogBase["sub_page_labels"]:
             post_info["bottom_text"] = ""
@@ -172,7 +991,73 @@ class GMEEK:
         self.render_html("post.html", post_info, post_icons, post_cfg["html_dir"])
         print(f'created post html {post_cfg["html_dir"]} from {post_cfg["post_title"]}')
 
-    def create_post_index_html(self):
+    def mirror_image_url(self, url: str) -> str:
+        """Return the absolute url of the mirrored image, or the url itself if not mirrored."""
+        if self.image_mirror is None or urllib.parse.urlparse(url).scheme not in ("http", "https"):
+            return url
+        image = self.image_mirror.mirror(url)
+        if image is None:
+            return url
+        return (
+            self.blogBase["home_url"] + "/" + self.assets_dir[len(self.root_dir) :] + image["name"]
+        )
+
+    @staticmethod
+    def index_page_name(page_idx: int):
+        """Return the file name of the index page in root_dir."""
+        return "index.html" if page_idx == 0 else f"page{page_idx}.html"
+
+    def label_page_name(self, label: str, page_idx: int = 0):
+        """Return the file name of the page of the label in root_dir."""
+        slug = self.blogBase["label_slugs"][label]
+        return f"tag/{slug}.html" if page_idx == 0 else f"tag/{slug}/page{page_idx}.html"
+
+    def assign_label_slugs(self):
+        """Assign the file names to the labels of the posts which do not have one yet.
+
+        Like the slugs of the posts, a name is kept once it is assigned. The path separators and
+        the other unsafe characters are replaced and the leading and trailing dots are stripped,
+        so the pages stay in `tag/`. If the name is taken by another label, ignoring the case,
+        the smallest free number is appended, e.g. "C/C++" and "C-C++" are "C-C++" and "C-C++-2".
+        """
+        labels = {label for info in self.blogBase["posts"].values() for label in info["labels"]}
+        label_slugs = {k: v for k, v in self.blogBase["label_slugs"].items() if k in labels}
+        used_slugs = {slug.lower() for slug in label_slugs.values()}
+        for label in sorted(labels - set(label_slugs)):
+            slug = re.sub(r"[<>:/\\|?*\"]|[\0-\31]", "-", label).strip(". ") or "label"
+            name, num = slug, 1
+            while name.lower() in used_slugs:
+                num += 1
+                name = f"{slug}-{num}"
+            if name != slug:
+                print(f"file name {slug} of label {label} is taken")
+            label_slugs[label] = name
+            used_slugs.add(name.lower())
+        self.blogBase["label_slugs"] = label_slugs
+
+    def create_list_pages(
+        self,
+        post_infos: list,
+        page_name: Callable,
+        page_vars: dict,
+        old_pages: dict,
+        new_pages: dict,
+    ):
+        """Render the posts into the pages of max_posts_per_page posts with plist.html.
+
+        A page is only re-rendered when its posts, its links or the site are changed, which is
+        found by comparing the fingerprints of the pages with the ones of the last run.
+
+        Args:
+            post_infos (list): (key, summary) of the posts in the order of the pages.
+            page_name (Callable): Index of the page -> file name of the page in root_dir.
+            page_vars (dict): Variables of the pages besides blogBase, e.g. the label.
+            old_pages (dict): File name -> fingerprint of the pages of the last run.
+            new_pages (dict): File name -> fingerprint, which is updated with the pages.
+
+        Returns:
+            int: The number of the rendered pages.
+        """
         index_icons = {
             k: ICONS[k]
             for k in ["sun", "moon", "sync", "search", "rss", "upload", "post"]
@@ -180,46 +1065,281 @@ class GMEEK:
         }
         index_icons.update(self.blogBase["icons"])
 
-        # all_post_infos = list(self.blogBase["posts"].items())
-        all_post_infos = sorted(
-            self.blogBase["posts"].items(),
-            key=lambda x: (x[1]["top"], x[1]["created_time"]),
-            reverse=True,
-        )
         max_posts_per_page = self.blogBase["max_posts_per_page"]
-        num_pages = math.ceil(len(all_post_infos) / max_posts_per_page)
+        num_pages = math.ceil(len(post_infos) / max_posts_per_page)
+
+        site_cfg = {
+            k: v for k, v in self.blogBase.items() if k not in ["posts"] + BUILD_STATE_KEYS
+        }
+        site_sha = hashlib.sha256(
+            json.dumps([site_cfg, page_vars], sort_keys=True, default=PostSummary.to_dict).encode(
+                "utf-8"
+            )
+        )
+        num_rendered = 0
         for page_idx in range(num_pages):
             start_idx = page_idx * max_posts_per_page
             end_idx = (page_idx + 1) * max_posts_per_page
-            curr_posts = OrderedDict(all_post_infos[start_idx:end_idx])
+            curr_posts = OrderedDict(post_infos[start_idx:end_idx])
+
+            page_info = ChainMap(dict(page_vars), self.blogBase)
+            page_info["og_image"] = self.mirror_image_url(self.blogBase["og_image"])
+            page_info["label_urls"] = {
+                label: urllib.parse.quote(self.label_page_name(label))
+                for post_info in curr_posts.values()
+                for label in post_info["labels"]
+            }
+            if page_idx == 0:  # the first page
+                page_info["prevUrl"] = "disabled"
+            else:
+                page_info["prevUrl"] = "/" + urllib.parse.quote(page_name(page_idx - 1))
+            if page_idx + 1 < num_pages:  # there is a next page
+                page_info["nextUrl"] = "/" + urllib.parse.quote(page_name(page_idx + 1))
+            else:  # current page is the last page with a full list
+                page_info["nextUrl"] = "disabled"
+
+            page_sha = site_sha.copy()
+            page_content = [page_info["prevUrl"], page_info["nextUrl"], list(curr_posts.items())]
+            page_content = json.dumps(page_content, sort_keys=True, default=PostSummary.to_dict)
+            page_sha.update(page_content.encode("utf-8"))
+            new_pages[page_name(page_idx)] = page_sha.hexdigest()
+            post_html = self.root_dir + page_name(page_idx)
+            if old_pages.get(page_name(page_idx)) == new_pages[page_name(page_idx)]:
+                if self.output_intact(post_html):
+                    continue
             print(f"Post Range={(start_idx, end_idx)} Number of Posts:{len(curr_posts)}")
+            os.makedirs(os.path.dirname(post_html), exist_ok=True)
+            self.render_html("plist.html", page_info, index_icons, post_html, curr_posts)
+            num_rendered += 1
+        return num_rendered
 
-            if page_idx == 0:
-                # the total number of posts is less than max_posts_per_page
-                post_html = self.root_dir + "index.html"
-                self.blogBase["prevUrl"] = "disabled"
-                if page_idx + 1 < num_pages:  # there is a next page
-                    self.blogBase["nextUrl"] = "/page1.html"
-                else:  # current page is the last page with a full list
-                    self.blogBase["nextUrl"] = "disabled"
-            else:
-                post_html = self.root_dir + f"page{page_idx}.html"
-                if page_idx == 1:
-                    self.blogBase["prevUrl"] = "/index.html"
-                else:
-                    self.blogBase["prevUrl"] = f"/page{page_idx-1}.html"
-                if page_idx + 1 < num_pages:  # there is a next page
-                    self.blogBase["nextUrl"] = f"/page{page_idx+1}.html"
-                else:  # current page is the last page with a full list
-                    self.blogBase["nextUrl"] = "disabled"
-            self.render_html("plist.html", self.blogBase, index_icons, post_html, curr_posts)
+    def sort_post_infos(self, post_infos: Iterable) -> list:
+        # the pinned posts first, and then the newer posts first
+        return sorted(post_infos, key=lambda x: (x[1]["top"], x[1]["created_time"]), reverse=True)
+
+    @build_stage("create_post_index_html")
+    def create_post_index_html(self):
+        all_post_infos = self.sort_post_infos(self.blogBase["posts"].items())
+        old_pages = self.blogBase["index_pages"]
+        new_pages = {}
+        num_rendered = self.create_list_pages(
+            all_post_infos, self.index_page_name, {}, old_pages, new_pages
+        )
+        print(f"{num_rendered}/{len(new_pages)} index pages are changed")
+
+        for name in set(old_pages) - set(new_pages):
+            print(f"remove outdated {name}")
+            self.remove_output(self.root_dir + name)
+        self.blogBase["index_pages"] = new_pages
 
         # create tag page
         tag_icons = {k: ICONS[k] for k in ["sun", "moon", "sync", "home", "search", "post"]}
         tag_html = self.root_dir + "tag.html"
-        self.render_html("tag.html", self.blogBase, tag_icons, tag_html, curr_posts)
+        # the label bar and the lists of the labels, without loading the list of all posts
+        label_counts = Counter(
+            label for post_info in self.blogBase["posts"].values() for label in post_info["labels"]
+        )
+        tag_info = ChainMap({}, self.blogBase)
+        tag_info["label_counts"] = dict(label_counts)
+        tag_info["label_lists"] = {
+            label: urllib.parse.quote(self.label_page_name(label)[: -len(".html")] + ".json")
+            for label in label_counts
+        }
+        self.render_html("tag.html", tag_info, tag_icons, tag_html)
 
-    def create_feed_xml(self):
+    @build_stage("create_label_pages")
+    def create_label_pages(self):
+        """Create the pages `tag/<label>.html` and the list `tag/<label>.json` of every label.
+
+        The pages of a label are only re-rendered when a post with the label is changed.
+        """
+        label_post_infos = {}
+        for key, post_info in self.sort_post_infos(self.blogBase["posts"].items()):
+            for label in post_info["labels"]:
+                label_post_infos.setdefault(label, []).append((key, post_info))
+
+        old_pages = self.blogBase["label_pages"]
+        new_pages = {}
+        num_rendered = 0
+        for label, post_infos in label_post_infos.items():
+            page_name = functools.partial(self.label_page_name, label)
+            page_vars = {"label": label}
+            num_rendered += self.create_list_pages(
+                post_infos, page_name, page_vars, old_pages, new_pages
+            )
+
+            post_list = {key: {k: info[k] for k in POST_ITEM_KEYS} for key, info in post_infos}
+            post_list_str = json.dumps(post_list, ensure_ascii=False, indent=2)
+            json_name = page_name()[: -len(".html")] + ".json"
+            new_pages[json_name] = hashlib.sha256(post_list_str.encode("utf-8")).hexdigest()
+            json_path = self.root_dir + json_name
+            if old_pages.get(json_name) != new_pages[json_name] or not self.output_intact(
+                json_path
+            ):
+                self.write_output(json_path, post_list_str)
+        print(f"{num_rendered} pages of {len(label_post_infos)} labels are changed")
+
+        for name in set(old_pages) - set(new_pages):
+            print(f"remove outdated {name}")
+            self.remove_output(self.root_dir + name)
+        self.blogBase["label_pages"] = new_pages
+
+    @staticmethod
+    def tokenize_search_text(text: str, with_pinyin: bool = False) -> set:
+        """Split the text into the lowercase words and the unigrams and bigrams of CJK runs.
+
+        Args:
+            text (str): Text to index.
+            with_pinyin (bool, optional): Also index the pinyin of the CJK runs, so that the
+                posts can be found by typing pinyin. Defaults to False.
+        """
+        terms = set()
+        for token in SEARCH_TOKEN_PATTERN.findall(text):
+            if not re.match(rf"[{SEARCH_CJK_CHARS}]", token):
+                terms.add(token.lower())
+                continue
+            terms.update(token)
+            terms.update(token[i : i + 2] for i in range(len(token) - 1))
+            if with_pinyin:
+                terms.add(get_pinyin().get_pinyin(token, "").lower())
+        return terms
+
+    @staticmethod
+    def search_shard_key(term: str):
+        # the same as `shardKey` in templates/tag.html
+        char = term[0]
+        if char in "abcdefghijklmnopqrstuvwxyz0123456789":
+            return char
+        return "u" + format(ord(char) >> 8, "x")
+
+    @staticmethod
+    def create_search_digest(post_cfg: dict, post_md: str) -> str:
+        """Hash the title, the labels and the markdown text that the search terms come from."""
+        text = json.dumps(
+            [post_cfg["post_title"], post_cfg["labels"], post_md], ensure_ascii=False
+        )
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+    def tokenize_post(self, post_info: PostSummary) -> set:
+        terms = self.tokenize_search_text(post_info["post_title"], with_pinyin=True)
+        terms.update(self.tokenize_search_text(" ".join(post_info["labels"])))
+        if os.path.exists(post_info["md_path"]):
+            with open(post_info["md_path"], "r", encoding="UTF-8") as f:
+                terms.update(self.tokenize_search_text(f.read()))
+        return terms
+
+    def load_search_terms(self, key: str) -> Optional[list]:
+        return self.state.load_search_terms(key)
+
+    def save_search_terms(self, key: str, terms: list):
+        self.state.save_search_terms(key, terms)
+
+    @build_stage("create_search_index")
+    def create_search_index(self):
+        """Create an inverted index over the titles, labels and bodies of the posts.
+
+        The index maps every term to the keys of the posts containing it, and it is sharded by
+        the first character of the terms into `search/<key>.json`, so the search page only
+        fetches the shards of the searched terms. The hits are shown with the chunks of the
+        posts in `search/posts/<n>.json`, which hold the title, the url, the labels and the date
+        of the posts numbered from n * SEARCH_CHUNK_SIZE.
+
+        Only the posts whose search_digest differs from the one in the index are tokenized, and
+        only the shards of their old and new terms are rewritten. The terms of every post are
+        kept in the state store to find the old terms.
+        """
+        print("====== create search index ======")
+        posts = self.blogBase["posts"]
+        indexed = self.blogBase["search_index"]
+        full = not os.path.exists(self.search_dir) or not indexed
+
+        changed_keys = [
+            key
+            for key, post_info in posts.items()
+            if full or key not in indexed or indexed[key] != post_info.get("search_digest")
+        ]
+        removed_keys = [key for key in indexed if key not in posts]
+        stale_shard_keys = set()  # the shards of the old terms of the changed and removed posts
+        for key in changed_keys + removed_keys:
+            if full or key not in indexed:
+                continue
+            old_terms = self.load_search_terms(key)
+            if old_terms is None:  # the state store is incomplete
+                print(f"the search terms of {key} are not found, rebuild the search index")
+                full = True
+                changed_keys = list(posts)
+                break
+            stale_shard_keys.update(self.search_shard_key(term) for term in old_terms)
+
+        # shard key -> term -> keys of the changed posts
+        new_postings = {}
+        for key in changed_keys:
+            terms = sorted(self.tokenize_post(posts[key]))
+            self.save_search_terms(key, terms)
+            for term in terms:
+                shard = new_postings.setdefault(self.search_shard_key(term), {})
+                shard.setdefault(term, []).append(key)
+
+        os.makedirs(self.search_dir, exist_ok=True)
+        stale_keys = set(changed_keys) | set(removed_keys)
+        shard_keys = stale_shard_keys | set(new_postings)
+        for shard_key in shard_keys:
+            shard_path = self.search_dir + f"{shard_key}.json"
+            shard = {}
+            if not full and os.path.exists(shard_path):
+                with open(shard_path, "r", encoding="utf-8") as f:
+                    shard = json.load(f)
+                shard = {
+                    term: [k for k in keys if k not in stale_keys] for term, keys in shard.items()
+                }
+            for term, keys in new_postings.get(shard_key, {}).items():
+                shard.setdefault(term, []).extend(keys)
+            shard = {term: sorted(shard[term]) for term in sorted(shard) if shard[term]}
+            if shard:
+                shard_str = json.dumps(shard, ensure_ascii=False, separators=(",", ":"))
+                self.write_output(shard_path, shard_str)
+            else:
+                self.remove_output(shard_path)
+        if full:
+            for entry in os.scandir(self.search_dir):
+                if entry.is_file() and entry.name[: -len(".json")] not in shard_keys:
+                    self.remove_output(entry.path)
+        self.blogBase["search_index"] = {k: v.get("search_digest") for k, v in posts.items()}
+        print(f"{len(changed_keys)} posts are indexed, {len(shard_keys)} shards are changed")
+
+        chunks = {}
+        for key, post_info in posts.items():
+            chunk = chunks.setdefault(int(key[1:]) // SEARCH_CHUNK_SIZE, {})
+            chunk[key] = {k: post_info[k] for k in POST_ITEM_KEYS}
+        chunk_dir = self.search_dir + "posts/"
+        os.makedirs(chunk_dir, exist_ok=True)
+        for chunk_idx, chunk in chunks.items():
+            chunk_str = json.dumps(dict(sorted(chunk.items())), ensure_ascii=False)
+            self.write_output(chunk_dir + f"{chunk_idx}.json", chunk_str)
+        for name in os.listdir(chunk_dir):
+            # skip the temporary files of the interrupted writes and the other stray files
+            if not name.endswith(".json") or not name[: -len(".json")].isdigit():
+                continue
+            if int(name[: -len(".json")]) not in chunks:
+                self.remove_output(chunk_dir + name)
+
+    def create_shared_pages(self):
+        """Create the index pages, the tag page, the label pages, the feed and the search index."""
+        self.assign_label_slugs()
+        self.create_post_index_html()
+        self.create_label_pages()
+        self.create_feed_xml()
+        self.create_search_index()
+
+    def create_rss(self, items: List[dict], links: dict, archive: bool = False) -> bytes:
+        """Create an RSS document of the items with the links of RFC 5005.
+
+        Args:
+            items (List[dict]): Items of the feed from the oldest.
+            links (dict): rel -> url, e.g. "self", "current" and "prev-archive".
+            archive (bool, optional): It is an archive feed, whose items do not change.
+                Defaults to False.
+        """
         feed = FeedGenerator()
         feed.title(self.blogBase["title"])
         feed.description(self.blogBase["sub_title"])
@@ -230,105 +1350,251 @@ class GMEEK:
         feed.webMaster(self.blogBase["title"])
         feed.ttl("60")
 
-        for num in self.blogBase["sub_pages"]:
+        for item_info in items:
             item = feed.add_item()
-            item.guid(
-                self.blogBase["home_url"] + "/" + self.blogBase["sub_pages"][num]["post_url"],
-                permalink=True,
-            )
-            item.title(self.blogBase["sub_pages"][num]["post_title"])
-            item.description(self.blogBase["sub_pages"][num]["description"])
-            item.link(
-                href=self.blogBase["home_url"] + "/" + self.blogBase["sub_pages"][num]["post_url"]
-            )
+            item.guid(item_info["url"], permalink=True)
+            item.title(item_info["title"])
+            item.description(item_info["description"])
+            item.link(href=item_info["url"])
             item.pubDate(
                 time.strftime(
-                    "%a, %d %b %Y %H:%M:%S +0000",
-                    time.gmtime(self.blogBase["sub_pages"][num]["created_time"]),
+                    "%a, %d %b %Y %H:%M:%S +0000", time.gmtime(item_info["created_time"])
                 )
             )
-
-        for post_info in sorted(
-            self.blogBase["posts"].values(), key=lambda x: x["created_time"], reverse=False
-        ):
-            item = feed.add_item()
-            item.guid(self.blogBase["home_url"] + "/" + post_info["post_url"], permalink=True)
-            item.title(post_info["post_title"])
-            item.description(post_info["description"])
-            item.link(href=self.blogBase["home_url"] + "/" + post_info["post_url"])
-            item.pubDate(
-                time.strftime(
-                    "%a, %d %b %Y %H:%M:%S +0000", time.gmtime(post_info["created_time"])
+        # The build date follows the newest item instead of the build time, so the feed is only
+        # rewritten when its items change.
+        if items:
+            feed.lastBuildDate(datetime.fromtimestamp(items[-1]["created_time"], timezone.utc))
+
+        # feedgen only supports the self link, the others are added to its output
+        rss = etree.fromstring(feed.rss_str())
+        channel = rss.find("channel")
+        position = channel.index(channel.find("item")) if items else len(channel)
+        elements = [
+            etree.Element(f"{{{ATOM_NAMESPACE}}}link", rel=rel, href=href)
+            for rel, href in links.items()
+        ]
+        if archive:
+            elements.append(
+                etree.Element(
+                    f"{{{FEED_HISTORY_NAMESPACE}}}archive", nsmap={"fh": FEED_HISTORY_NAMESPACE}
                 )
             )
+        for element in reversed(elements):
+            channel.insert(position, element)
+        return etree.tostring(rss, xml_declaration=True, encoding="UTF-8")
+
+    def create_json_feed(self, items: List[dict]) -> str:
+        """Create a JSON Feed (https://jsonfeed.org/version/1.1) of the items from the newest."""
+        feed = {
+            "version": "https://jsonfeed.org/version/1.1",
+            "title": self.blogBase["title"],
+            "home_page_url": self.blogBase["home_url"],
+            "feed_url": self.blogBase["home_url"] + "/feed.json",
+            "description": self.blogBase["sub_title"],
+            "icon": self.blogBase["avatar_url"],
+            "items": [
+                {
+                    "id": item_info["url"],
+                    "url": item_info["url"],
+                    "title": item_info["title"],
+                    "summary": item_info["description"],
+                    "content_text": item_info["description"],
+                    "date_published": datetime.fromtimestamp(
+                        item_info["created_time"], timezone.utc
+                    ).isoformat(),
+                    "tags": item_info["labels"],
+                }
+                for item_info in reversed(items)
+            ],
+        }
+        return json.dumps(feed, ensure_ascii=False, indent=2)
 
-        if self.old_feed_string != "":
-            feed.rss_file(self.root_dir + "new.xml")
-            with open(self.root_dir + "new.xml", "r", encoding="utf-8") as f:
-                new = f.read()
+    @build_stage("create_feed_xml")
+    def create_feed_xml(self):
+        """Create the RSS feed of the newest posts, its archives and the JSON Feed.
 
-            new = re.sub(r"<lastBuildDate>.*?</lastBuildDate>", "", new)
-            old = re.sub(r"<lastBuildDate>.*?</lastBuildDate>", "", self.old_feed_string)
-            os.remove(self.root_dir + "new.xml")
+        `rss.xml` and `feed.json` have the `rss_max_items` newest items. The older items are in the
+        archive feeds `feed/archive-<n>.xml` of RFC 5005, which are full pages numbered from the
+        oldest, so the new posts do not change the archives. The current feed overlaps the newest
+        archive, which RFC 5005 allows. A feed is only created when the fingerprint of its items
+        and links differs from the last run.
+        """
+        items = []
+        for post_type in ["sub_pages", "posts"]:
+            for post_info in self.blogBase[post_type].values():
+                items.append(
+                    {
+                        "url": self.blogBase["home_url"] + "/" + post_info["post_url"],
+                        "title": post_info["post_title"],
+                        "description": post_info["description"],
+                        "created_time": post_info["created_time"],
+                        "labels": post_info["labels"],
+                    }
+                )
+        items.sort(key=lambda x: x["created_time"])
+        site_info = [
+            self.blogBase[k] for k in ["title", "sub_title", "home_url", "avatar_url"]
+        ] + [__VERSION__]
+        item_shas = [
+            hashlib.sha256(json.dumps(item, sort_keys=True).encode("utf-8")).hexdigest()
+            for item in items
+        ]
 
-            if new == old:
-                print("====== rss xml no update ======")
-                with open(self.root_dir + "rss.xml", "w") as f:
-                    f.write(self.old_feed_string)
-                return
+        max_items = self.blogBase["rss_max_items"] or max(len(items), 1)
+        num_archives = max(len(items) - 1, 0) // max_items
+        home_url = self.blogBase["home_url"] + "/"
+        archive_dir = self.feed_archive_dir[len(self.root_dir) :]
+        archive_names = [f"{archive_dir}archive-{n}.xml" for n in range(1, num_archives + 1)]
+
+        # file name -> (start and end of the items, links, whether it is an archive)
+        pages = {}
+        links = {"self": home_url + "rss.xml"}
+        if archive_names:
+            links["prev-archive"] = home_url + archive_names[-1]
+        pages["rss.xml"] = (max(len(items) - max_items, 0), len(items), links, False)
+        pages["feed.json"] = (max(len(items) - max_items, 0), len(items), {}, False)
+        for i, name in enumerate(archive_names):
+            links = {"self": home_url + name, "current": home_url + "rss.xml"}
+            if i > 0:
+                links["prev-archive"] = home_url + archive_names[i - 1]
+            if i + 1 < num_archives:
+                links["next-archive"] = home_url + archive_names[i + 1]
+            pages[name] = (i * max_items, (i + 1) * max_items, links, True)
+
+        old_pages = self.blogBase["feed_pages"]
+        new_pages = {}
+        num_created = 0
+        for name, (start, end, links, archive) in pages.items():
+            page_content = [site_info, links, archive, item_shas[start:end]]
+            new_pages[name] = hashlib.sha256(json.dumps(page_content).encode("utf-8")).hexdigest()
+            path = self.root_dir + name
+            if old_pages.get(name) == new_pages[name] and self.output_intact(path):
+                continue
+            if name == "feed.json":
+                content = self.create_json_feed(items[start:end])
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                content = self.create_rss(items[start:end], links, archive)
+            num_created += int(self.write_output(path, content))
 
-        print("====== create rss xml ======")
-        feed.rss_file(self.root_dir + "rss.xml")
+        for name in set(old_pages) - set(new_pages):
+            print(f"remove outdated {name}")
+            self.remove_output(self.root_dir + name)
+        self.blogBase["feed_pages"] = new_pages
+        print(f"====== {num_created}/{len(pages)} feeds are created ======")
 
-    def create_file_name(self, issue: Issue, useLabel: bool = False):
+    def create_file_name(self, issue: IssueRecord, useLabel: bool = False):
         if useLabel:
-            fileName = issue.labels[0].name
+            fileName = issue.labels[0]
         else:
             if self.blogBase["url_mode"] == "issue":
                 fileName = str(issue.number)
             elif self.blogBase["url_mode"] == "ru_translit":
-                fileName = translit(issue.title, language_code="ru", reversed=True)
+                fileName = get_translit("ru")(issue.title, reversed=True)
                 fileName = str(fileName).replace(" ", "-")
             else:
-                fileName = Pinyin().get_pinyin(issue.title)
+                fileName = get_pinyin().get_pinyin(issue.title)
         return re.sub(r"[<>:/\\|?*\"]|[\0-\31]", "-", fileName)
 
-    def update_post_info(self, issue: Issue):
-        """Update the posts and sub_pages based on the issue information.
+    def load_build_state(self, old_blog_base: dict):
+        """Reuse the slugs and the fingerprints of the generated pages of the last run.
 
-        Args:
-            issue (Issue): issue object.
+        The slugs are dropped if url_mode has been changed since then.
+        """
+        if old_blog_base.get("slug_mode") == self.blogBase["url_mode"]:
+            self.blogBase["slugs"] = old_blog_base["slugs"]
+        # the fingerprints of the pages, which are written by the last run
+        self.blogBase["index_pages"] = old_blog_base.get("index_pages", {})
+        self.blogBase["label_pages"] = old_blog_base.get("label_pages", {})
+        self.blogBase["feed_pages"] = old_blog_base.get("feed_pages", {})
+        self.blogBase["search_index"] = old_blog_base.get("search_index", {})
+        self.blogBase["label_slugs"] = old_blog_base.get("label_slugs", {})
+
+    def assign_slugs(
+        self, issues: Iterable[IssueRecord], prune: bool = False
+    ) -> Iterator[IssueRecord]:
+        """Assign the file names to the posts of the issues which do not have one yet.
+
+        A file name is kept once it is assigned, so the url of a post does not change with its
+        title. If the name is taken by another post, the issue number is appended to it, and
+        then the smallest free number if that is taken too. Since the issues come in the order
+        of their numbers, the older post always keeps the plain name.
+
+        The issues are yielded as soon as they are assigned, so that a stream of issues is
+        rendered while it is being fetched.
 
-        Returns:
-            str: "sub_pages" or "posts".
+        Args:
+            issues (Iterable[IssueRecord]): The issues to assign, from the oldest.
+            prune (bool, optional): The issues are all open issues, and the slugs of the others
+                are released once the issues are exhausted. Defaults to False.
+        """
+        slugs = self.blogBase["slugs"]
+        used_slugs = set(slugs.values())
+        seen_keys = set()
+        for issue in issues:
+            key = f"P{issue.number}"
+            if issue.labels[0] not in self.blogBase["sub_page_labels"]:
+                seen_keys.add(key)
+                if key not in slugs:
+                    slug = self.create_file_name(issue, useLabel=False)
+                    if slug in used_slugs:
+                        print(f"file name {slug} of issue {issue.number} is taken")
+                        base, n = f"{slug}-{issue.number}", 1
+                        slug = base
+                        while slug in used_slugs:  # e.g. the title of another post ends with it
+                            n += 1
+                            slug = f"{base}-{n}"
+                    slugs[key] = slug
+                    used_slugs.add(slug)
+            yield issue
+
+        if prune:
+            for key in set(slugs) - seen_keys:
+                del slugs[key]
+
+    def post_paths(self, issue: IssueRecord) -> tuple:
+        """Return the post type, the html path and the backup path of the post of the issue.
+
+        The backup is named by the issue number and the html name instead of the title, so the
+        posts of the same title do not share a backup and a new title does not move it.
         """
         # TODO: 这里只考虑了标签列表中的第一个标签
-        if issue.labels[0].name in self.blogBase["sub_page_labels"]:
+        if issue.labels[0] in self.blogBase["sub_page_labels"]:
             post_type = "sub_pages"
             html_name = self.create_file_name(issue, useLabel=True)
             html_path = self.root_dir + f"{html_name}.html"
         else:
             post_type = "posts"
-            html_name = self.create_file_name(issue, useLabel=False)
+            html_name = self.blogBase["slugs"][f"P{issue.number}"]
             html_path = self.post_dir + f"{html_name}.html"
+        md_path = self.backup_dir + f"{issue.number}-{html_name}.md"
+        return post_type, html_path, md_path
+
+    @build_stage("issue_metadata")
+    def update_post_info(self, issue: IssueRecord):
+        """Update the posts and sub_pages based on the issue information.
+
+        Args:
+            issue (IssueRecord): issue record.
+
+        Returns:
+            str: "sub_pages" or "posts".
+        """
+        post_type, html_path, md_path = self.post_paths(issue)
 
         post_cfg = {}
         post_cfg["html_dir"] = html_path
-        post_cfg["labels"] = [label.name for label in issue.labels]
-        # post_cfg["labelColor"]=self.label_color_info[issue.labels[0].name]
+        post_cfg["labels"] = list(issue.labels)
+        # post_cfg["labelColor"]=self.label_color_info[issue.labels[0]]
         post_cfg["post_title"] = issue.title
         post_cfg["post_url"] = urllib.parse.quote(html_path[len(self.root_dir) :])
         post_cfg["post_source_url"] = (
             "https://github.com/" + self.repo_name + "/issues/" + str(issue.number)
         )
-        post_cfg["num_comments"] = issue.get_comments().totalCount
-
-        post_cfg["top"] = 0
-        for event in issue.get_events():
-            if event.event == "pinned":
-                post_cfg["top"] = 1
-            # elif event.event == "unpinned":
-            #     post_cfg["top"] = 0
+        post_cfg["num_comments"] = issue.num_comments
+        post_cfg["top"] = issue.top
+        post_cfg["updated_time"] = int(time.mktime(issue.updated_at.timetuple()))
 
         post_cfg["num_words"] = len(issue.body)
         post_cfg["description"] = self.generate_post_description(issue.body)
@@ -347,6 +1613,7 @@ class GMEEK:
         post_cfg["style"] = self.blogBase["style"] + custom_post_cfg.get("style", "")
         post_cfg["script"] = self.blogBase["script"] + custom_post_cfg.get("script", "")
         post_cfg["og_image"] = custom_post_cfg.get("og_image", self.blogBase["og_image"])
+        post_cfg["show_toc"] = custom_post_cfg.get("show_toc", self.blogBase["show_toc"])
 
         thisTime = datetime.fromtimestamp(post_cfg["created_time"]).astimezone(self.TZ)
         thisYear = thisTime.year
@@ -355,16 +1622,30 @@ class GMEEK:
             int(thisYear) % len(self.blogBase["year_colors"])
         ]
 
-        md_name = re.sub(r"[<>:/\\|?*\"]|[\0-\31]", "-", issue.title)
-        md_path = self.backup_dir + md_name + ".md"
         post_cfg["md_path"] = md_path
         if issue.body is not None:
             with open(md_path, "w", encoding="UTF-8") as f:
                 f.write(issue.body)
+            self.report.add_bytes_written(len(issue.body.encode("utf-8")))
 
         # self.blogBase[post_type][f"P{issue.number}"] = post_cfg
         return post_type, post_cfg
 
+    def build_post(self, issue: IssueRecord):
+        """Render the post of the issue and save its state.
+
+        Returns:
+            tuple: "sub_pages" or "posts", and the summary of the post for blogBase.
+        """
+        post_type, post_cfg = self.update_post_info(issue)
+        # the same as reading the backup file written by update_post_info in the text mode
+        post_md = issue.body.replace("\r\n", "\n").replace("\r", "\n")
+        self.create_post_html(post_cfg, post_md)
+        post_cfg["search_digest"] = self.create_search_digest(post_cfg, post_md)
+        self.state.save_post(f"P{issue.number}", post_cfg)
+        return post_type, self.state.summarize(post_cfg)
+
+    @build_stage("update_all_posts")
     def update_all_posts(self):
         print("====== start create all posts html ======")
 
@@ -380,100 +1661,187 @@ class GMEEK:
         os.mkdir(self.backup_dir)
         os.mkdir(self.root_dir)
         os.mkdir(self.post_dir)
+        self.manifest = {}
 
-        # Only use the open issues
-        for issue in self.repo.get_issues(state="open"):
-            if len(issue.labels) < 1:
-                continue
+        # Only use the open issues, which are rendered while the next ones are being fetched, and
+        # only the summaries of the rendered posts are kept.
+        issues = (issue for issue in self.iter_issue_records() if len(issue.labels) > 0)
+        issues = self.assign_slugs(issues, prune=True)
+        for issue, (post_type, post_summary) in self.stream_concurrently(self.build_post, issues):
+            self.blogBase[post_type][f"P{issue.number}"] = post_summary
+        self.sort_posts_by_number()
 
-            post_type, post_cfg = self.update_post_info(issue)
-            self.blogBase[post_type][f"P{issue.number}"] = post_cfg
-            self.create_post_html(post_cfg)
-
-        self.create_post_index_html()
-        self.create_feed_xml()
+        self.create_shared_pages()
         print("====== create all posts html end ======")
 
-    def update_single_post(self, number: str):
-        print("====== start create single post html ======")
+    @build_stage("update_changed_posts")
+    def update_changed_posts(self, old_blog_base: dict):
+        """Re-render the posts changed since the last run and remove the outdated pages.
 
-        issue = self.repo.get_issue(int(number))
-        if len(issue.labels) < 1:
+        A post is kept as it is when its issue has the same update time, comment count and pin
+        state as recorded in the state store, and the fingerprint of the site is unchanged.
+        """
+        print("====== start create changed posts html ======")
+
+        rebuild_all = old_blog_base.get("fingerprint") != self.blogBase["fingerprint"]
+        if rebuild_all:
+            print("config or templates are changed, re-render all posts")
+
+        old_posts = {}
+        for post_type in ["posts", "sub_pages"]:
+            for key, post_cfg in old_blog_base[post_type].items():
+                old_posts[key] = (post_type, post_cfg)
+
+        os.makedirs(self.backup_dir, exist_ok=True)
+        os.makedirs(self.post_dir, exist_ok=True)
+
+        counts = Counter()
+
+        def iter_changed_issues(issues: Iterable[IssueRecord]) -> Iterator[IssueRecord]:
+            """Keep the summaries of the unchanged posts and yield the changed issues."""
+            for issue in issues:
+                key = f"P{issue.number}"
+                post_type, post_cfg = old_posts.get(key, (None, None))
+                counts["all"] += 1
+                if (
+                    rebuild_all
+                    or post_cfg is None
+                    or post_cfg.get("updated_time")
+                    != int(time.mktime(issue.updated_at.timetuple()))
+                    or post_cfg["num_comments"] != issue.num_comments
+                    or post_cfg["top"] != issue.top
+                    or not self.output_intact(post_cfg["html_dir"])
+                    # the backups named by the titles of the older versions are moved
+                    or post_cfg["md_path"] != self.post_paths(issue)[2]
+                ):
+                    counts["changed"] += 1
+                    yield issue
+                else:
+                    self.blogBase[post_type][key] = post_cfg
+
+        issues = (issue for issue in self.iter_issue_records() if len(issue.labels) > 0)
+        issues = iter_changed_issues(self.assign_slugs(issues, prune=True))
+        for issue, (post_type, post_summary) in self.stream_concurrently(self.build_post, issues):
+            self.blogBase[post_type][f"P{issue.number}"] = post_summary
+        self.sort_posts_by_number()
+        print(f"{counts['changed']}/{counts['all']} posts are changed")
+
+        # Remove the pages of the closed, unlabelled or renamed posts
+        used_paths = set()
+        for post_type in ["posts", "sub_pages"]:
+            for post_cfg in self.blogBase[post_type].values():
+                used_paths.update([post_cfg["html_dir"], post_cfg["md_path"]])
+        for post_type, post_cfg in old_posts.values():
+            for path in [post_cfg["html_dir"], post_cfg["md_path"]]:
+                if path not in used_paths and os.path.exists(path):
+                    print(f"remove outdated {path}")
+                    self.remove_output(path)
+        self.remove_unused_assets()
+
+        self.create_shared_pages()
+        print("====== create changed posts html end ======")
+
+    def sort_posts_by_number(self):
+        """Order the posts and sub pages newest first, as the issues are listed on GitHub."""
+        for post_type in ["posts", "sub_pages"]:
+            post_infos = sorted(self.blogBase[post_type].items(), key=lambda x: -int(x[0][1:]))
+            self.blogBase[post_type] = dict(post_infos)
+
+    def remove_unused_assets(self):
+        """Remove the mirrored images which are not used by any post."""
+        if not os.path.exists(self.assets_dir):
             return
-
-        post_type, post_cfg = self.update_post_info(issue)
-        self.blogBase[post_type][f"P{number}"] = post_cfg
-        self.create_post_html(post_cfg)
-
-        self.create_post_index_html()
-        self.create_feed_xml()
-        print("====== create single post html end ======")
+        used_names = {self.mirror_image_url(self.blogBase["og_image"]).rsplit("/", 1)[-1]}
+        for post_type in ["posts", "sub_pages"]:
+            for post_cfg in self.blogBase[post_type].values():
+                used_names.update(post_cfg.get("assets", []))
+                used_names.add(self.mirror_image_url(post_cfg["og_image"]).rsplit("/", 1)[-1])
+        for name in os.listdir(self.assets_dir):
+            if name not in used_names:
+                print(f"remove unused asset {name}")
+                self.remove_output(self.assets_dir + name)
+
+    @build_stage("update_issue_posts")
+    def update_issue_posts(self, numbers: List[int]):
+        """Update the posts of the given issues, then create the shared pages once for all."""
+        print(f"====== start create posts html of issues {numbers} ======")
+
+        issues = self.map_concurrently(self.get_issue_record, sorted(numbers))
+        issues = list(self.assign_slugs(issue for issue in issues if len(issue.labels) > 0))
+
+        results = self.map_concurrently(self.build_post, issues)
+        for issue, (post_type, post_summary) in zip(issues, results):
+            key = f"P{issue.number}"
+            for old_type in ["posts", "sub_pages"]:
+                old_summary = self.blogBase[old_type].get(key)
+                if old_summary is None:
+                    continue
+                if old_type != post_type:
+                    del self.blogBase[old_type][key]
+                # e.g. the backup named by the title in the older versions
+                for path in [old_summary["html_dir"], old_summary["md_path"]]:
+                    if path not in [post_summary["html_dir"], post_summary["md_path"]]:
+                        print(f"remove outdated {path}")
+                        self.remove_output(path)
+            self.blogBase[post_type][key] = post_summary
+
+        self.create_shared_pages()
+        print("====== create posts html of issues end ======")
 
     def update_blog_base(self):
-        if not os.path.exists("blogBase.json"):
-            print("blogBase is not exists, run_all")
+        if os.path.exists("blogBase.json"):
+            self.state.migrate("blogBase.json")
+
+        run_one = False
+        if not self.state.exists():
+            print("state is not exists, run_all")
             self.update_all_posts()
         else:
-            if os.path.exists(self.root_dir + "rss.xml"):
-                with open(self.root_dir + "rss.xml", "r", encoding="utf-8") as f:
-                    self.old_feed_string = f.read()
+            old_blog_base = self.state.load()
+            self.load_build_state(old_blog_base)
 
-            if self.issue_number == "0" or self.issue_number == "":
-                print(f"issue_number=={self.issue_number}, run_all")
-                self.update_all_posts()
+            if not self.issue_numbers:
+                if self.blogBase["incremental_build"] and os.path.exists(self.root_dir):
+                    print("no issue_number, run_changed")
+                    self.update_changed_posts(old_blog_base)
+                else:
+                    print("no issue_number, run_all")
+                    self.update_all_posts()
             else:
-                print("blogBase is exists and issue_number!=0, run_one")
-                with open("blogBase.json", "r") as f:
-                    old_blog_base = json.load(f)
-
+                print(f"state is exists and issue_number=={self.issue_numbers}, run_issues")
+                run_one = True
                 for key, value in old_blog_base.items():
                     self.blogBase[key] = value
 
-                self.update_single_post(self.issue_number)
+                self.update_issue_posts(self.issue_numbers)
 
-        with open("blogBase.json", "w") as f:
-            json.dump(self.blogBase, f, indent=2)
+        self.prune_cache(self.markdown_cache_dir, self.blogBase["markdown_cache_size"])
+        self.prune_cache(self.http_cache_dir, self.blogBase["http_cache_size"])
+        if self.image_mirror is not None:
+            self.image_mirror.save()
+        self.state.save(self.blogBase, prune=not run_one)
 
+    @build_stage("update_post_list_json")
     def update_post_list_json(self):
         print("====== create postList.json file ======")
 
-        sorted_post_infos = OrderedDict(
-            sorted(
-                self.blogBase["posts"].items(), key=lambda x: x[1]["created_time"], reverse=True
-            )
-        )
-
         num_comments = 0
         num_words = 0
-        useless_keys = [
-            "description",
-            "post_source_url",
-            "html_dir",
-            "created_time",
-            "script",
-            "style",
-            "top",
-            "og_image",
-        ]
-        for i in sorted_post_infos:
-            for k in useless_keys:
-                if k in sorted_post_infos[i]:
-                    del sorted_post_infos[i][k]
-
-            if "num_comments" in sorted_post_infos[i]:
-                num_comments = num_comments + sorted_post_infos[i]["num_comments"]
-                del sorted_post_infos[i]["num_comments"]
-
-            if "num_words" in sorted_post_infos[i]:
-                num_words = num_words + sorted_post_infos[i]["num_words"]
-                del sorted_post_infos[i]["num_words"]
+        sorted_post_infos = OrderedDict()
+        for key, post_info in sorted(
+            self.blogBase["posts"].items(), key=lambda x: x[1]["created_time"], reverse=True
+        ):
+            # only the keys used by the search page
+            sorted_post_infos[key] = {k: post_info[k] for k in POST_LIST_KEYS if k in post_info}
+            num_comments += post_info.get("num_comments", 0)
+            num_words += post_info.get("num_words", 0)
 
         sorted_post_infos["label_color_info"] = self.label_color_info
 
-        with open(self.root_dir + "postList.json", "w") as f:
-            json.dump(sorted_post_infos, f, indent=2)
+        self.write_output(self.root_dir + "postList.json", json.dumps(sorted_post_infos, indent=2))
         return num_comments, num_words
 
+    @build_stage("update_readme_md")
     def update_readme_md(self, num_comments, num_words):
         print("====== update readme file ======")
         workspace_path = os.environ.get("GITHUB_WORKSPACE")
@@ -489,8 +1857,7 @@ class GMEEK:
                 "*Powered by [GmeekSelf](https://github.com/lartpang/GmeekSelf) modified from [Gmeek](https://github.com/Meekdai/Gmeek)*",
             ]
         )
-        with open(workspace_path + "/README.md", "w") as f:
-            f.write(readme)
+        self.write_output(workspace_path + "/README.md", readme)
 
 
 def main():
@@ -499,14 +1866,47 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("github_token", help="github_token")
     parser.add_argument("repo_name", help="repo_name")
-    parser.add_argument("--issue_number", help="issue_number", default=0, required=False)
+    parser.add_argument(
+        "--issue_number",
+        help="issue numbers separated by commas or spaces, 0 or empty to check all issues",
+        default="",
+        required=False,
+    )
+    parser.add_argument(
+        "--queue_file",
+        help="file of the pending issue numbers, which are built with issue_number and then "
+        "removed from it",
+    )
+    parser.add_argument("--profile", help="dump the cProfile stats of the main thread to it")
     args = parser.parse_args()
 
-    blog = GMEEK(args.github_token, args.repo_name, args.issue_number)
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    issue_numbers = parse_issue_numbers(args.issue_number)
+    if args.queue_file and os.path.exists(args.queue_file):
+        with open(args.queue_file, "r", encoding="utf-8") as f:
+            queued_numbers = parse_issue_numbers(f.read())
+        issue_numbers = list(dict.fromkeys(issue_numbers + queued_numbers))
+
+    blog = GMEEK(args.github_token, args.repo_name, issue_numbers)
     blog.update_blog_base()
+    if args.queue_file and os.path.exists(args.queue_file):
+        # only the numbers read above are removed, the ones queued during the build are kept
+        with open(args.queue_file, "r", encoding="utf-8") as f:
+            pending = [n for n in parse_issue_numbers(f.read()) if n not in issue_numbers]
+        with open(args.queue_file, "w", encoding="utf-8") as f:
+            f.write("".join(f"{n}\n" for n in pending))
     num_comments, num_words = blog.update_post_list_json()
+    blog.save_manifest()
     if os.environ.get("GITHUB_EVENT_NAME") != "schedule":
         blog.update_readme_md(num_comments, num_words)
+    blog.save_report()
+
+    if args.profile:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""Local mirror of the images referenced by the posts.
+
+Every image is downloaded once and stored by the hash of its content, so an image used by many
+posts or runs is kept once, and its url never changes while its content stays the same. The
+downloaded files and the map from the urls to them are kept in `cache/images/`, and the files
+used by the posts are copied into `docs/assets/`.
+
+If Pillow is installed, the narrower variants of the raster images are generated for `srcset`.
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+from typing import Callable, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from postprocess import Rewriter
+
+CONTENT_TYPE_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/gif": "gif",
+    "image/webp": "webp",
+    "image/svg+xml": "svg",
+    "image/avif": "avif",
+}
+RESIZABLE_EXTENSIONS = {"png": "PNG", "jpg": "JPEG", "webp": "WEBP"}
+
+
+class ImageMirror:
+    def __init__(
+        self,
+        session: requests.Session,
+        cache_dir: str,
+        assets_dir: str,
+        widths: List[int],
+        write: Callable,
+    ):
+        """
+        Args:
+            session (requests.Session): Session for downloading, which must not carry the token
+                of GitHub since the images may be hosted anywhere.
+            cache_dir (str): Directory of the downloaded files and the url map.
+            assets_dir (str): Directory of the published files.
+            widths (List[int]): Widths of the resized variants.
+            write (Callable): (path, content) -> whether the file is written.
+        """
+        self.session = session
+        self.cache_dir = cache_dir
+        self.assets_dir = assets_dir
+        self.widths = sorted(widths)
+        self.write = write
+        self.index_path = cache_dir + "index.json"
+        self.images = {}  # url -> {"name", "width", "variants": {width: name}}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.images = json.load(f)
+        self.failed_urls = set()  # not retried in the same run
+        self.lock = threading.Lock()
+        self.url_locks = {}
+
+    def download(self, url: str) -> Optional[dict]:
+        try:
+            response = self.session.get(url, timeout=30)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"failed to mirror {url}: {e}")
+            return None
+
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        ext = CONTENT_TYPE_EXTENSIONS.get(content_type)
+        if ext is None:
+            print(f"skip mirroring {url} of the content type {content_type!r}")
+            return None
+
+        digest = hashlib.sha256(response.content).hexdigest()[:20]
+        image = {"name": f"{digest}.{ext}", "width": None, "variants": {}}
+        self.save_file(image["name"], response.content)
+        if ext in RESIZABLE_EXTENSIONS:
+            self.create_variants(image, response.content, ext)
+        return image
+
+    def create_variants(self, image: dict, data: bytes, ext: str):
+        try:
+            from PIL import Image
+        except ImportError:
+            return
+
+        try:
+            with Image.open(io.BytesIO(data)) as original:
+                image["width"] = original.width
+                for width in self.widths:
+                    if width >= original.width:
+                        break
+                    height = round(original.height * width / original.width)
+                    resized = original.resize((width, height), Image.LANCZOS)
+                    if ext == "jpg" and resized.mode not in ("RGB", "L"):
+                        resized = resized.convert("RGB")
+                    output = io.BytesIO()
+                    resized.save(output, RESIZABLE_EXTENSIONS[ext], optimize=True)
+                    name = image["name"].replace(".", f"-{width}w.")
+                    self.save_file(name, output.getvalue())
+                    image["variants"][str(width)] = name
+        # a corrupt or truncated image, which Pillow may also report by SyntaxError
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+            print(f"keep {image['name']} without the variants: {e!r}")
+            image["width"] = None
+            image["variants"] = {}
+
+    def save_file(self, name: str, data: bytes):
+        os.makedirs(self.cache_dir + "files/", exist_ok=True)
+        tmp_path = f"{self.cache_dir}files/{name}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.cache_dir + "files/" + name)
+
+    def publish(self, name: str) -> bool:
+        """Copy the cached file into the assets, which is skipped if it is already there."""
+        path = self.assets_dir + name
+        if os.path.exists(path):
+            return True
+        cache_path = self.cache_dir + "files/" + name
+        if not os.path.exists(cache_path):
+            return False
+        os.makedirs(self.assets_dir, exist_ok=True)
+        with open(cache_path, "rb") as f:
+            self.write(path, f.read())
+        return True
+
+    def mirror(self, url: str) -> Optional[dict]:
+        """Mirror the image of the url once, the concurrent callers of the same url wait for it.
+
+        Returns:
+            dict: The file names of the image and its variants, or None if it is not mirrored.
+        """
+        with self.lock:
+            url_lock = self.url_locks.setdefault(url, threading.Lock())
+        with url_lock:
+            if url in self.failed_urls:
+                return None
+            with self.lock:
+                image = self.images.get(url)
+            names = [image["name"], *image["variants"].values()] if image else []
+            if image is None or not all(self.publish(name) for name in names):
+                # never mirrored, or the cached files have been evicted
+                image = self.download(url)
+                if image is None:
+                    self.failed_urls.add(url)
+                    return None
+                for name in [image["name"], *image["variants"].values()]:
+                    self.publish(name)
+                with self.lock:
+                    self.images[url] = image
+        return image
+
+    def save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self.lock:
+            images = dict(sorted(self.images.items()))
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(images, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+
+class ImageMirrorRewriter(Rewriter):
+    """Point the images of a post to their mirrors in the assets and add their srcset."""
+
+    def __init__(self, mirror: ImageMirror, assets_url: str):
+        self.mirror = mirror
+        self.assets_url = assets_url
+        self.names = set()  # the mirrored files used by the post
+
+    def start_tag(self, tag, attrs):
+        src = attrs.get("src") or ""
+        if tag != "img" or urlparse(src).scheme not in ("http", "https"):
+            return attrs
+        image = self.mirror.mirror(src)
+        if image is None:
+            return attrs
+
+        attrs["src"] = self.assets_url + image["name"]
+        self.names.add(image["name"])
+        if image["variants"]:
+            srcset = [f"{self.assets_url}{name} {w}w" for w, name in image["variants"].items()]
+            srcset.append(f"{self.assets_url}{image['name']} {image['width']}w")
+            attrs["srcset"] = ", ".join(srcset)
+            attrs.setdefault("sizes", f"(max-width: {image['width']}px) 100vw, {image['width']}px")
+            self.names.update(image["variants"].values())
+        return attrs
+
+    def finish(self, page):
+        page["assets"] = sorted(self.names)
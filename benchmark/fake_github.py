@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+"""A local stand-in of the GitHub API serving a synthetic repository.
+
+It serves the REST, GraphQL and `/markdown` endpoints used by GMEEK, counts the requests per
+endpoint, and supports `If-None-Match` with `ETag` like the real API. Point GMEEK at it with the
+`GITHUB_API_URL` environment variable.
+
+Besides the GitHub endpoints, it has some endpoints for the benchmark itself:
+
+- `GET /_bench/counts`: the request counts since the last reset.
+- `POST /_bench/reset`: reset the request counts.
+- `POST /_bench/touch/<number>`: edit the body of an issue and bump its update time.
+
+It also serves the images attached to the synthetic issues at `/user-attachments/assets/<id>`,
+of which the one of `CORRUPT_ASSET_ID` is a truncated PNG.
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import gfm  # noqa: E402
+
+WORDS = (
+    "gmeek blog issue label python markdown template render cache page index feed search "
+    "thread pool memory token request github action deploy commit branch review profile "
+    "深度 学习 模型 训练 数据 网络 优化 推理 论文 实验 代码 笔记 记录 总结 方法 结果 问题 "
+    "分析 系统 性能 工具 环境 配置 部署 博客 文章 评论 标签 搜索"
+).split()
+LANGS = ["python", "javascript", "bash", "cpp", "json", ""]
+LABEL_COLORS = ["d73a4a", "0075ca", "cfd3d7", "a2eeef", "7057ff", "008672", "e4e669", "d876e3"]
+BASE_TIME = 1577836800  # 2020-01-01
+CORRUPT_ASSET_ID = 0  # one of the shared images, see SyntheticRepo.create_body
+
+
+def iso_time(timestamp: float):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def create_png(width: int, height: int, color: bytes):
+    """Create a PNG image of a single RGB color."""
+
+    def chunk(kind: bytes, data: bytes):
+        return (
+            struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+        )
+
+    rows = (b"\0" + color * width) * height
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+class SyntheticRepo:
+    """A repository of synthetic issues, which are generated on demand from the seed."""
+
+    def __init__(self, full_name: str, num_issues: int, num_labels: int = 20, seed: int = 0):
+        self.full_name = full_name
+        self.owner, self.name = full_name.split("/")
+        self.num_issues = num_issues
+        self.seed = seed
+        self.labels = [
+            {"name": f"label{i}", "color": LABEL_COLORS[i % len(LABEL_COLORS)]}
+            for i in range(num_labels)
+        ]
+        self.labels.append({"name": "about", "color": "ededed"})
+        self.edits = {}  # number -> (body suffix, updated time)
+        self.asset_url = "https://github.com/user-attachments/assets"
+
+    def rng(self, number: int):
+        return random.Random(self.seed * 1_000_003 + number)
+
+    def create_body(self, rnd: random.Random, number: int):
+        blocks = [f"<!-- synthetic issue {number} -->"]
+        for _ in range(rnd.randint(3, 30)):
+            kind = rnd.random()
+            if kind < 0.1:
+                blocks.append("## " + " ".join(rnd.choices(WORDS, k=rnd.randint(2, 6))))
+            elif kind < 0.2:
+                lang = rnd.choice(LANGS)
+                code = "\n".join(
+                    "x = " + " + ".join(rnd.choices("abcdef", k=4))
+                    for _ in range(rnd.randint(2, 12))
+                )
+                blocks.append(f"```{lang}\n{code}\n```")
+            elif kind < 0.25:
+                blocks.append("$$\n\\sum_{i=1}^{n} x_i^2 = y\n$$")
+            elif kind < 0.3:
+                # a few images are shared by many issues like the logos
+                asset_id = rnd.getrandbits(64) if rnd.random() < 0.8 else rnd.randint(0, 9)
+                blocks.append(f"![image]({self.asset_url}/{asset_id:016x})")
+            elif kind < 0.4:
+                blocks.append(
+                    "\n".join("- " + " ".join(rnd.choices(WORDS, k=5)) for _ in range(4))
+                )
+            else:
+                text = " ".join(rnd.choices(WORDS, k=rnd.randint(20, 120)))
+                if rnd.random() < 0.2:
+                    text += " with $a_i + b_i$ inline"
+                blocks.append(text)
+        return "\r\n\r\n".join(blocks)
+
+    def issue(self, number: int):
+        """Return the issue as a dict, or None if it does not exist."""
+        if not 1 <= number <= self.num_issues:
+            return None
+
+        rnd = self.rng(number)
+        created = BASE_TIME + number * 3600 + rnd.randint(0, 3599)
+        if number <= max(1, self.num_issues // 200):
+            labels = ["about"] if number == 1 else []  # a sub page and some unlabelled issues
+        else:
+            labels = sorted({l["name"] for l in rnd.sample(self.labels[:-1], rnd.randint(1, 3))})
+        body = self.create_body(rnd, number)
+        updated = created + rnd.randint(0, 86400)
+        if number in self.edits:
+            suffix, updated = self.edits[number]
+            body += suffix
+        return {
+            "number": number,
+            "title": " ".join(rnd.choices(WORDS, k=rnd.randint(2, 6))) + f" {number}",
+            "body": body,
+            "labels": labels,
+            "created_at": created,
+            "updated_at": updated,
+            "comments": rnd.choice([0, 0, 0, 1, 2, 3, 5, 8, 13, 21]),
+            "pinned": rnd.random() < 0.01,
+            "state": "closed" if rnd.random() < 0.05 else "open",
+        }
+
+    def open_issues(self, ascending: bool = False):
+        """Yield the open issues, newest first like the default order of the API."""
+        numbers = range(1, self.num_issues + 1) if ascending else range(self.num_issues, 0, -1)
+        for number in numbers:
+            issue = self.issue(number)
+            if issue["state"] == "open":
+                yield issue
+
+    def touch(self, number: int):
+        count = len(self.edits) + 1
+        self.edits[number] = (f"\r\n\r\nedited {count}", time.time())
+
+
+class FakeGitHub:
+    """Serve a synthetic repository like the GitHub API on a local port."""
+
+    def __init__(self, repo: SyntheticRepo, latency: float = 0.0, host: str = "127.0.0.1"):
+        self.repo = repo
+        self.latency = latency
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, 0), self.create_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+        self.repo.asset_url = self.url + "/user-attachments/assets"
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, route: str):
+        with self.lock:
+            self.counts[route] += 1
+
+    def repo_json(self):
+        repo_url = f"{self.url}/repos/{self.repo.full_name}"
+        return {
+            "id": 1,
+            "name": self.repo.name,
+            "full_name": self.repo.full_name,
+            "owner": {"login": self.repo.owner, "url": f"{self.url}/users/{self.repo.owner}"},
+            "url": repo_url,
+            "html_url": f"https://github.com/{self.repo.full_name}",
+        }
+
+    def label_json(self, label: dict):
+        return {
+            "name": label["name"],
+            "color": label["color"],
+            "url": f"{self.url}/repos/{self.repo.full_name}/labels/{label['name']}",
+        }
+
+    def issue_json(self, issue: dict):
+        colors = {l["name"]: l for l in self.repo.labels}
+        return {
+            "id": issue["number"],
+            "number": issue["number"],
+            "title": issue["title"],
+            "body": issue["body"],
+            "state": issue["state"],
+            "labels": [self.label_json(colors[name]) for name in issue["labels"]],
+            "comments": issue["comments"],
+            "created_at": iso_time(issue["created_at"]),
+            "updated_at": iso_time(issue["updated_at"]),
+            "url": f"{self.url}/repos/{self.repo.full_name}/issues/{issue['number']}",
+            "html_url": f"https://github.com/{self.repo.full_name}/issues/{issue['number']}",
+        }
+
+    def comments_json(self, issue: dict):
+        return [
+            {
+                "id": issue["number"] * 1000 + i,
+                "body": f"comment {i}",
+                "created_at": iso_time(issue["updated_at"]),
+                "user": {"login": "reader"},
+            }
+            for i in range(issue["comments"])
+        ]
+
+    def events_json(self, issue: dict):
+        events = [{"id": i, "event": "labeled"} for i, _ in enumerate(issue["labels"])]
+        if issue["pinned"]:
+            events.append({"id": len(events), "event": "pinned"})
+        return events
+
+    def graphql_issue(self, issue: dict):
+        return {
+            "number": issue["number"],
+            "title": issue["title"],
+            "body": issue["body"],
+            "createdAt": iso_time(issue["created_at"]),
+            "updatedAt": iso_time(issue["updated_at"]),
+            "labels": {"nodes": [{"name": name} for name in issue["labels"]]},
+            "comments": {"totalCount": issue["comments"]},
+            "timelineItems": {"totalCount": int(issue["pinned"])},
+        }
+
+    def graphql(self, query: str, variables: dict):
+        if "issues(" in query:
+            offset = int(variables.get("cursor") or 0)
+            ascending = re.search(r"issues\([^)]*direction: ASC", query) is not None
+            issues = list(self.repo.open_issues(ascending))
+            page = issues[offset : offset + variables["num"]]
+            has_next = offset + len(page) < len(issues)
+            data = {
+                "issues": {
+                    "pageInfo": {"hasNextPage": has_next, "endCursor": str(offset + len(page))},
+                    "nodes": [self.graphql_issue(issue) for issue in page],
+                }
+            }
+        elif "issue(" in query:
+            issue = self.repo.issue(variables["number"])
+            data = {"issue": issue and self.graphql_issue(issue)}
+        else:
+            return {"errors": [{"message": "unsupported query"}]}
+        return {"data": {"repository": data}}
+
+    def create_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, data, status=200, headers=None):
+                body = json.dumps(data).encode("utf-8")
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.send_header("X-RateLimit-Limit", "5000")
+                self.send_header("X-RateLimit-Remaining", "4999")
+                self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_page(self, items):
+                query = {k: v[-1] for k, v in parse_qs(urlparse(self.path).query).items()}
+                per_page = int(query.get("per_page", 30))
+                page = int(query.get("page", 1))
+                last = max(1, -(-len(items) // per_page))
+                links = []
+                for rel, num in [("next", page + 1), ("last", last)]:
+                    if page < last:
+                        url = fake.url + urlparse(self.path).path
+                        links.append(f'<{url}?{urlencode({**query, "page": num})}>; rel="{rel}"')
+                headers = {"Link": ", ".join(links)} if links else {}
+                self.send_json(items[(page - 1) * per_page : page * per_page], headers=headers)
+
+            def read_json(self):
+                length = int(self.headers.get("Content-Length", 0))
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                repo_path = f"/repos/{fake.repo.full_name}"
+                if path == "/_bench/counts":
+                    with fake.lock:
+                        return self.send_json(dict(fake.counts))
+
+                time.sleep(fake.latency)
+                if path.startswith("/user-attachments/assets/"):
+                    fake.count("GET /user-attachments/assets/:id")
+                    asset_id = int(path.rsplit("/", 1)[1], 16)
+                    color = asset_id.to_bytes(8, "big")[-3:]
+                    body = create_png(640 + asset_id % 1280, 360 + asset_id % 720, color)
+                    if asset_id == CORRUPT_ASSET_ID:
+                        body = body[: len(body) // 2]
+                    self.send_response(200)
+                    self.send_header("Content-Type", "image/png")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    return self.wfile.write(body)
+                if path == repo_path:
+                    fake.count("GET /repos/:repo")
+                    return self.send_json(fake.repo_json())
+                if path == repo_path + "/labels":
+                    fake.count("GET /repos/:repo/labels")
+                    return self.send_page([fake.label_json(l) for l in fake.repo.labels])
+                if path == repo_path + "/issues":
+                    fake.count("GET /repos/:repo/issues")
+                    query = parse_qs(urlparse(self.path).query)
+                    issues = fake.repo.open_issues(query.get("direction") == ["asc"])
+                    return self.send_page([fake.issue_json(i) for i in issues])
+                if path == "/rate_limit":
+                    fake.count("GET /rate_limit")
+                    core = {"limit": 5000, "remaining": 4999, "reset": int(time.time()) + 3600}
+                    return self.send_json({"resources": {"core": core}, "rate": core})
+
+                match = re.fullmatch(repo_path + r"/issues/(\d+)(/comments|/events)?", path)
+                issue = match and fake.repo.issue(int(match.group(1)))
+                if not issue:
+                    fake.count("GET 404")
+                    return self.send_json({"message": "Not Found"}, status=404)
+                if match.group(2) == "/comments":
+                    fake.count("GET /repos/:repo/issues/:number/comments")
+                    return self.send_page(fake.comments_json(issue))
+                if match.group(2) == "/events":
+                    fake.count("GET /repos/:repo/issues/:number/events")
+                    return self.send_page(fake.events_json(issue))
+                fake.count("GET /repos/:repo/issues/:number")
+                return self.send_json(fake.issue_json(issue))
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                payload = self.read_json()
+                if path == "/_bench/reset":
+                    with fake.lock:
+                        fake.counts.clear()
+                    return self.send_json({})
+                if path.startswith("/_bench/touch/"):
+                    fake.repo.touch(int(path.rsplit("/", 1)[1]))
+                    return self.send_json({})
+
+                time.sleep(fake.latency)
+                if path == "/markdown":
+                    fake.count("POST /markdown")
+                    body = gfm.render(payload["text"]).encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html;charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    return self.wfile.write(body)
+                if path == "/graphql":
+                    fake.count("POST /graphql")
+                    return self.send_json(fake.graphql(payload["query"], payload["variables"]))
+                fake.count("POST 404")
+                return self.send_json({"message": "Not Found"}, status=404)
+
+        return Handler
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Measure how GMEEK scales with the size of the repository.
+
+Every size is built against a local stand-in of the GitHub API (see `fake_github.py`) in a fresh
+working directory. Two phases are measured for each size, each in a separate process so that the
+peak RSS belongs to that phase only, with the stage timings taken from the build report of GMEEK:
+
+- full: the first build without any state, i.e. `update_all_posts`.
+- single: the rebuild after one issue is edited, i.e. `update_issue_posts`.
+
+Usage:
+    python benchmark/run_benchmark.py --issues 100 1000 5000 --latency 0.01 --output bench.json
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from fake_github import FakeGitHub, SyntheticRepo  # noqa: E402
+
+REPO_NAME = "bench/blog"
+
+
+@contextmanager
+def working_dir(path: str):
+    old_path = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(old_path)
+
+
+def create_workspace(path: str, config: dict):
+    os.symlink(os.path.join(ROOT_DIR, "templates"), os.path.join(path, "templates"))
+    blog_config = {
+        "title": "Benchmark",
+        "sub_title": "A synthetic blog",
+        "avatar_url": "https://github.com/github.png",
+        "script": "",
+        "style": "",
+        "sub_page_labels": ["about"],
+        "home_url": "https://bench.github.io",
+    }
+    blog_config.update(config)
+    with open(os.path.join(path, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(blog_config, f)
+
+
+def run_phase(api_url: str, issue_number: str):
+    """Build the blog in the current directory and return the measurements of the phase."""
+    import requests
+
+    import Gmeek
+
+    requests.post(api_url + "/_bench/reset")
+    start = time.perf_counter()
+    blog = Gmeek.GMEEK("token", REPO_NAME, issue_number)
+    blog.update_blog_base()
+    blog.update_post_list_json()
+    blog.save_manifest()
+    wall_seconds = time.perf_counter() - start
+    blog.save_report()
+
+    # the requests are counted by the stand-in, the 304s by the build report
+    counts = requests.get(api_url + "/_bench/counts").json()
+    return {
+        "wall_seconds": round(wall_seconds, 4),
+        "requests": sum(counts.values()),
+        "not_modified": blog.report.num_not_modified,
+        "requests_per_endpoint": counts,
+        "stages": blog.report.to_dict()["stages"],
+    }
+
+
+def run_child(args):
+    """Run one phase in this process and write the measurements to args.result."""
+    os.environ["GITHUB_API_URL"] = args.api_url
+    os.environ["GITHUB_WORKSPACE"] = args.workspace
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w")
+
+    with working_dir(args.workspace):
+        result = run_phase(args.api_url, args.issue_number)
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    with open(args.result, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+def run_size(num_issues: int, args):
+    repo = SyntheticRepo(REPO_NAME, num_issues, seed=args.seed)
+    fake = FakeGitHub(repo, latency=args.latency).start()
+    config = {"max_workers": args.workers, "fetch_mode": args.fetch_mode}
+    config["markdown_renderer"] = args.renderer
+    try:
+        with tempfile.TemporaryDirectory(prefix="gmeek-bench-") as workspace:
+            create_workspace(workspace, config)
+            result_path = os.path.join(workspace, "result.json")
+            touched = next(repo.open_issues())["number"]  # the newest post
+            results = {}
+            for phase, issue_number in [("full", "0"), ("single", str(touched))]:
+                if phase == "single":
+                    repo.touch(touched)
+                command = [sys.executable, os.path.abspath(__file__), "--child"]
+                command += ["--api-url", fake.url, "--workspace", workspace]
+                command += ["--result", result_path, "--issue-number", issue_number]
+                command += ["--verbose"] if args.verbose else []
+                subprocess.run(command, check=True)
+                with open(result_path, "r", encoding="utf-8") as f:
+                    results[phase] = json.load(f)
+            return results
+    finally:
+        fake.stop()
+
+
+def print_result(num_issues: int, result: dict):
+    for phase, info in result.items():
+        print(
+            f"issues={num_issues:<6d} phase={phase:<6s} wall={info['wall_seconds']:8.2f}s "
+            f"requests={info['requests']:<6d} not_modified={info['not_modified']:<6d} peak_rss={info['peak_rss_mb']:8.1f}MB"
+        )
+        for name, stage in info["stages"].items():
+            print(
+                f"    {name:<24s} {stage['seconds']:8.2f}s  calls={stage['calls']:<6d} "
+                f"requests={stage['requests']}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--issues", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--workers", type=int, default=4, help="max_workers of GMEEK")
+    parser.add_argument("--fetch-mode", default="graphql", choices=["graphql", "rest"])
+    parser.add_argument("--renderer", default="api", choices=["api", "local"])
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per API request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write all measurements into this json file")
+    parser.add_argument("--verbose", action="store_true", help="show the output of GMEEK")
+    # used by the child process of each phase
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--api-url", help=argparse.SUPPRESS)
+    parser.add_argument("--workspace", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    parser.add_argument("--issue-number", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args)
+
+    results = {}
+    for num_issues in args.issues:
+        results[num_issues] = run_size(num_issues, args)
+        print_result(num_issues, results[num_issues])
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
 NEWLINE_CHAR = "\r\n"
 
+# Kana, CJK ideographs and Hangul, which are indexed as character unigrams and bigrams because
+# they are not separated by spaces. Keep it the same as `CJK_CHARS` in templates/tag.html.
+SEARCH_CJK_CHARS = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+
 I18N = {
     "EN": {
         "Search": "Search",
@@ -10,6 +14,7 @@ I18N = {
         "days": " days",
         "Previous": "Previous",
         "Next": "Next",
+        "toc": "Contents",
     },
     "CN": {
         "Search": "搜索",
@@ -20,6 +25,7 @@ I18N = {
         "days": "天",
         "Previous": "上一页",
         "Next": "下一页",
+        "toc": "目录",
     },
     "RU": {
         "Search": "Поиск",
@@ -30,6 +36,7 @@ I18N = {
         "days": " дней",
         "Previous": "Предыдущая",
         "Next": "Следующая",
+        "toc": "Содержание",
     },
 }
 
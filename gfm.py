@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Local GitHub Flavored Markdown renderer.
+
+It is an offline alternative to the GitHub Markdown API. The code blocks and the math formulas
+are emitted in the same form as the API does, so the rewriters in `postprocess.py`
+(highlight detection and `<math-renderer>` stripping for MathJax) work for both renderers.
+"""
+
+from markdown_it import MarkdownIt
+from markdown_it.common.utils import escapeHtml
+from mdit_py_plugins.anchors import anchors_plugin
+from mdit_py_plugins.dollarmath import dollarmath_plugin
+from mdit_py_plugins.footnote import footnote_plugin
+from mdit_py_plugins.tasklists import tasklists_plugin
+
+
+def render_code(code: str, lang: str = ""):
+    if lang:
+        return (
+            f'<div class="highlight highlight-source-{escapeHtml(lang)} notranslate '
+            f'position-relative overflow-auto" dir="auto"><pre>{escapeHtml(code)}</pre></div>\n'
+        )
+    return (
+        '<div class="snippet-clipboard-content notranslate position-relative overflow-auto">'
+        f'<pre class="notranslate"><code>{escapeHtml(code)}</code></pre></div>\n'
+    )
+
+
+def render_inline_math(math: str):
+    return (
+        '<math-renderer class="js-inline-math" style="display: inline">'
+        f"${escapeHtml(math)}$</math-renderer>"
+    )
+
+
+def render_display_math(math: str):
+    return (
+        '<math-renderer class="js-display-math" style="display: block">'
+        f"$${escapeHtml(math.strip())}$$</math-renderer>\n"
+    )
+
+
+def fence_rule(self, tokens, idx, options, env):
+    info = tokens[idx].info.strip()
+    lang = info.split(maxsplit=1)[0] if info else ""
+    if lang == "math":
+        return render_display_math(tokens[idx].content)
+    return render_code(tokens[idx].content, lang)
+
+
+def code_block_rule(self, tokens, idx, options, env):
+    return render_code(tokens[idx].content)
+
+
+def inline_math_rule(self, tokens, idx, options, env):
+    return render_inline_math(tokens[idx].content)
+
+
+def display_math_rule(self, tokens, idx, options, env):
+    return render_display_math(tokens[idx].content)
+
+
+def create_markdown() -> MarkdownIt:
+    # gfm-like: tables, strikethrough, autolinks and raw html
+    md = (
+        MarkdownIt("gfm-like")
+        .use(tasklists_plugin)
+        .use(footnote_plugin)
+        .use(anchors_plugin, max_level=6)
+        .use(dollarmath_plugin, double_inline=True)
+    )
+    md.add_render_rule("fence", fence_rule)
+    md.add_render_rule("code_block", code_block_rule)
+    md.add_render_rule("math_inline", inline_math_rule)
+    md.add_render_rule("math_inline_double", display_math_rule)
+    md.add_render_rule("math_block", display_math_rule)
+    md.add_render_rule("math_block_label", display_math_rule)
+    return md
+
+
+# The parser keeps no state between renders, so a single instance is shared by all threads.
+MARKDOWN = create_markdown()
+
+
+def render(mdstr: str):
+    """Render the markdown text into html like the GitHub Markdown API in the gfm mode."""
+    return MARKDOWN.render(mdstr)
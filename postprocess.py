@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""Single-pass post-processing of the rendered html of the posts.
+
+The html is tokenized once by `HTMLParser`, and every tag and text is passed through a list of
+rewriters, so that a new rewrite does not add another scan over the whole body. The tags which
+are not changed by any rewriter are written back exactly as they are in the input.
+
+A rewriter can change or drop the tags and collect the variables of the post page, e.g. whether
+it contains math formulas. See `Rewriter` for the interface.
+"""
+
+import html
+from html.parser import HTMLParser
+from typing import List, Optional
+
+HEADING_TAGS = ["h1", "h2", "h3", "h4", "h5", "h6"]
+
+
+class Rewriter:
+    """Base of the rewriters, a new instance is used for every post."""
+
+    def start_tag(self, tag: str, attrs: dict) -> Optional[dict]:
+        """Return the attributes of the tag, or None to drop the tag."""
+        return attrs
+
+    def end_tag(self, tag: str) -> bool:
+        """Return whether to keep the end tag."""
+        return True
+
+    def text(self, text: str):
+        pass
+
+    def finish(self, page: dict):
+        """Add the variables of the post page collected from the html into page."""
+
+
+class MathRewriter(Rewriter):
+    """Strip the `<math-renderer>` tags of the formulas, which are typeset by MathJax."""
+
+    def __init__(self):
+        self.found = False
+
+    def start_tag(self, tag, attrs):
+        if tag == "math-renderer":
+            self.found = True
+            return None
+        return attrs
+
+    def end_tag(self, tag):
+        return tag != "math-renderer"
+
+    def finish(self, page):
+        page["math"] = int(self.found)
+
+
+class HighlightRewriter(Rewriter):
+    """Find the highlighted code blocks, whose class is `highlight highlight-source-<lang>`."""
+
+    def __init__(self):
+        self.found = False
+
+    def start_tag(self, tag, attrs):
+        if "highlight" in (attrs.get("class") or "").split():
+            self.found = True
+        return attrs
+
+    def finish(self, page):
+        page["highlight"] = int(self.found)
+
+
+class LazyImageRewriter(Rewriter):
+    """Let the browsers load the images when they are scrolled into view."""
+
+    def start_tag(self, tag, attrs):
+        if tag == "img":
+            attrs.setdefault("loading", "lazy")
+            attrs.setdefault("decoding", "async")
+        return attrs
+
+
+class TocRewriter(Rewriter):
+    """Collect the headings with their anchors into a table of contents.
+
+    The GitHub Markdown API puts the anchor of a heading into the `<a class="anchor">` after it,
+    and the local renderer puts it into the id of the heading.
+    """
+
+    def __init__(self):
+        self.entries = []  # [level, anchor, text]
+        self.heading = None  # the entry of the heading whose text is being collected
+
+    def start_tag(self, tag, attrs):
+        if tag in HEADING_TAGS:
+            self.heading = [int(tag[1]), attrs.get("id"), ""]
+            self.entries.append(self.heading)
+        elif tag == "a" and "anchor" in (attrs.get("class") or "").split():
+            if self.entries and self.entries[-1][1] is None:
+                self.entries[-1][1] = attrs.get("id") or (attrs.get("href") or "").lstrip("#")
+        return attrs
+
+    def end_tag(self, tag):
+        if tag in HEADING_TAGS:
+            self.heading = None
+        return True
+
+    def text(self, text):
+        if self.heading is not None:
+            self.heading[2] += text
+
+    def finish(self, page):
+        items = []
+        levels = []  # the levels of the open lists
+        for level, anchor, text in self.entries:
+            if not anchor:
+                continue
+            while levels and levels[-1] > level:
+                items.append("</li></ul>")
+                levels.pop()
+            if levels and levels[-1] == level:
+                items.append("</li>")
+            else:
+                items.append("<ul>")
+                levels.append(level)
+            anchor = html.escape(anchor, quote=True)
+            items.append(f'<li><a href="#{anchor}">{html.escape(text.strip())}</a>')
+        items.append("</li></ul>" * len(levels))
+        page["toc"] = "".join(items)
+
+
+class PostProcessor(HTMLParser):
+    def __init__(self, rewriters: List[Rewriter]):
+        super().__init__(convert_charrefs=False)
+        self.rewriters = rewriters
+        self.output = []
+
+    def rewrite_start_tag(self, tag: str, attrs: list, self_closing: bool):
+        new_attrs = dict(attrs)
+        for rewriter in self.rewriters:
+            new_attrs = rewriter.start_tag(tag, new_attrs)
+            if new_attrs is None:
+                return
+        if list(new_attrs.items()) == attrs:
+            self.output.append(self.get_starttag_text())
+            return
+
+        parts = [tag]
+        for name, value in new_attrs.items():
+            parts.append(name if value is None else f'{name}="{html.escape(value, quote=True)}"')
+        self.output.append("<" + " ".join(parts) + (" />" if self_closing else ">"))
+
+    def handle_starttag(self, tag, attrs):
+        self.rewrite_start_tag(tag, attrs, self_closing=False)
+
+    def handle_startendtag(self, tag, attrs):
+        self.rewrite_start_tag(tag, attrs, self_closing=True)
+
+    def handle_endtag(self, tag):
+        if all([rewriter.end_tag(tag) for rewriter in self.rewriters]):
+            self.output.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        for rewriter in self.rewriters:
+            rewriter.text(data)
+        self.output.append(data)
+
+    def handle_entityref(self, name):
+        self.handle_raw(f"&{name};")
+
+    def handle_charref(self, name):
+        self.handle_raw(f"&#{name};")
+
+    def handle_raw(self, raw: str):
+        for rewriter in self.rewriters:
+            rewriter.text(html.unescape(raw))
+        self.output.append(raw)
+
+    def handle_comment(self, data):
+        self.output.append(f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        self.output.append(f"<!{decl}>")
+
+    def handle_pi(self, data):
+        self.output.append(f"<?{data}>")
+
+    def unknown_decl(self, data):
+        self.output.append(f"<![{data}]>")
+
+
+def process(html_str: str, rewriters: List[Rewriter]):
+    """Pass the html through the rewriters in a single pass.
+
+    Returns:
+        tuple: The rewritten html and the variables of the post page collected by the rewriters.
+    """
+    processor = PostProcessor(rewriters)
+    processor.feed(html_str)
+    processor.close()
+
+    page = {}
+    for rewriter in rewriters:
+        rewriter.finish(page)
+    return "".join(processor.output), page
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""Preview the blog locally without GitHub.
+
+The blog is built from the state of the last run of Gmeek.py (`state/`) and the markdown backups
+(`backup/*.md`) with the local markdown renderer, into a separate directory, so that `docs/` and
+the state are left as they are. The directory is served on localhost, and `templates/`,
+`config.json` and the backups are watched for the changes:
+
+- a template: the pages using it are re-rendered, found by the `extends`/`include`/`import` graph
+  of the templates;
+- a backup: the post is re-rendered, and then its entries in the feeds and the search index,
+  since the index and label pages do not show the body;
+- `config.json`: everything is rebuilt.
+
+Usage:
+    python serve.py owner/repo --port 8000
+"""
+
+import argparse
+import functools
+import os
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from jinja2 import meta
+
+from Gmeek import GMEEK
+
+# the templates rendered by GMEEK -> the kind of the pages rendered from them
+PAGE_TEMPLATES = {"post.html": "posts", "plist.html": "lists", "tag.html": "lists"}
+
+
+def timed(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        print(f"{func.__name__} in {time.perf_counter() - start:.3f}s")
+        return result
+
+    return wrapper
+
+
+class PreviewGMEEK(GMEEK):
+    def __init__(self, repo_name: str, root_dir: str, home_url: str):
+        self.preview_home_url = home_url
+        self.search_terms = {}  # key -> terms, kept out of the state of the last run
+        super().__init__("", repo_name, [], root_dir=root_dir)
+
+    def initialize_config(self):
+        super().initialize_config()
+        self.blogBase["home_url"] = self.preview_home_url
+        self.blogBase["markdown_renderer"] = "local"  # without the GitHub Markdown API
+
+    def fetch_label_colors(self) -> dict:
+        # the colors of the last run instead of the ones from GitHub
+        if not self.state.exists():
+            return {}
+        return self.state.load()["label_color_info"]
+
+    def load_search_terms(self, key: str):
+        return self.search_terms.get(key)
+
+    def save_search_terms(self, key: str, terms: list):
+        self.search_terms[key] = terms
+
+
+class PreviewBuilder:
+    def __init__(self, repo_name: str, output_dir: str, home_url: str):
+        self.repo_name = repo_name
+        self.output_dir = output_dir
+        self.home_url = home_url
+        self.blog = None
+        self.post_cfgs = {}  # key -> full configuration of the post, with the html in output_dir
+        self.md_keys = {}  # markdown path -> key of the post
+
+    @timed
+    def build_all(self):
+        blog = PreviewGMEEK(self.repo_name, self.output_dir, self.home_url)
+        if not blog.state.exists():
+            raise SystemExit("state/ is not found, run Gmeek.py first")
+
+        old_blog_base = blog.state.load()
+        for key in ["posts", "sub_pages", "slugs", "label_slugs"]:
+            blog.blogBase[key] = old_blog_base[key]
+        os.makedirs(blog.post_dir, exist_ok=True)
+
+        self.post_cfgs = {}
+        for post_type in ["posts", "sub_pages"]:
+            for key in blog.blogBase[post_type]:
+                post_cfg = blog.state.load_post(key)
+                # the pages of the last run are in docs/
+                post_cfg["html_dir"] = self.output_dir + post_cfg["html_dir"].split("/", 1)[1]
+                self.post_cfgs[key] = post_cfg
+        self.md_keys = {
+            os.path.normpath(cfg["md_path"]): key for key, cfg in self.post_cfgs.items()
+        }
+
+        self.blog = blog
+        blog.map_concurrently(blog.create_post_html, list(self.post_cfgs.values()))
+        blog.create_shared_pages()
+        blog.save_manifest()
+
+    @timed
+    def rebuild_templates(self, names: set):
+        """Re-render the pages using the changed templates."""
+        env = self.blog.jinja_env
+        kinds = set()
+        for page_template, kind in PAGE_TEMPLATES.items():
+            if names & template_dependencies(env, page_template):
+                kinds.add(kind)
+        print(f"templates {sorted(names)} changed, re-render {sorted(kinds) or 'nothing'}")
+
+        if "posts" in kinds:
+            self.blog.map_concurrently(self.blog.create_post_html, list(self.post_cfgs.values()))
+        if "lists" in kinds:
+            # forget the fingerprints, since they do not cover the templates in the preview
+            self.blog.blogBase["index_pages"] = {}
+            self.blog.blogBase["label_pages"] = {}
+            self.blog.create_post_index_html()
+            self.blog.create_label_pages()
+
+    @timed
+    def rebuild_posts(self, md_paths: set):
+        """Re-render the posts of the changed backups, and update the feeds and the search index.
+
+        The summaries of the posts are updated with the new body, of which the description is
+        in the feeds and the digest decides the posts to index again.
+        """
+        blog = self.blog
+        keys = [self.md_keys[path] for path in md_paths if path in self.md_keys]
+        print(f"backups {sorted(md_paths)} changed, re-render {keys}")
+        for key in keys:
+            post_cfg = self.post_cfgs[key]
+            with open(post_cfg["md_path"], "r", encoding="UTF-8") as f:
+                post_md = f.read()
+            post_cfg["num_words"] = len(post_md)
+            post_cfg["description"] = blog.generate_post_description(post_md)
+            blog.create_post_html(post_cfg, post_md)
+            post_cfg["search_digest"] = blog.create_search_digest(post_cfg, post_md)
+            post_type = "posts" if key in blog.blogBase["posts"] else "sub_pages"
+            blog.blogBase[post_type][key] = blog.state.summarize(post_cfg)
+        if keys:
+            blog.create_feed_xml()
+            blog.create_search_index()
+
+
+def template_dependencies(env, name: str, seen: set = None) -> set:
+    """Return the template and all templates it extends, includes or imports."""
+    seen = set() if seen is None else seen
+    if name in seen:
+        return seen
+    seen.add(name)
+    source = env.loader.get_source(env, name)[0]
+    for ref in meta.find_referenced_templates(env.parse(source)):
+        if ref is not None:  # None for the dynamic names
+            template_dependencies(env, ref, seen)
+    return seen
+
+
+def snapshot(paths: list) -> dict:
+    """Return the modification times of the files under the paths."""
+    mtimes = {}
+    for path in paths:
+        if os.path.isfile(path):
+            mtimes[os.path.normpath(path)] = os.stat(path).st_mtime_ns
+        elif os.path.isdir(path):
+            for entry in os.scandir(path):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    mtimes[os.path.normpath(entry.path)] = entry.stat().st_mtime_ns
+    return mtimes
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(output_dir: str, host: str, port: int):
+    handler = functools.partial(QuietHandler, directory=output_dir)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("repo_name", help="repo_name")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--output", default="preview/", help="directory of the preview")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between checks")
+    args = parser.parse_args()
+
+    output_dir = args.output.rstrip("/") + "/"
+    builder = PreviewBuilder(args.repo_name, output_dir, f"http://{args.host}:{args.port}")
+    builder.build_all()
+    serve(output_dir, args.host, args.port)
+    print(f"serving {output_dir} at http://{args.host}:{args.port}, press Ctrl+C to stop")
+
+    watched = ["templates", "config.json", builder.blog.backup_dir]
+    mtimes = snapshot(watched)
+    try:
+        while True:
+            time.sleep(args.interval)
+            new_mtimes = snapshot(watched)
+            changed = {
+                p for p in set(mtimes) | set(new_mtimes) if mtimes.get(p) != new_mtimes.get(p)
+            }
+            mtimes = new_mtimes
+            if not changed:
+                continue
+
+            try:
+                if os.path.normpath("config.json") in changed:
+                    print("config.json changed, rebuild all")
+                    builder.build_all()
+                    continue
+                templates = {os.path.basename(p) for p in changed if p.startswith("templates")}
+                if templates:
+                    builder.rebuild_templates(templates)
+                md_paths = changed - {p for p in changed if p.startswith("templates")}
+                if md_paths:
+                    builder.rebuild_posts(md_paths)
+                builder.blog.save_manifest()
+            except Exception as e:  # keep serving while the templates are being edited
+                print(f"failed to rebuild: {e!r}")
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()